@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches final answers keyed by the query embedding.
+    - A lookup hits when a cached query has cosine similarity >= `threshold`.
+    - Entries expire after `ttl` seconds; the least recently used entry is evicted past `max_entries`.
+    - `version_fn` returns a fingerprint of the source data; when it changes, the cache is cleared.
+      It is called at most every `version_check_interval` seconds, by one caller, outside the lock.
+
+    Only cache answers built purely from general school knowledge, never student records.
+    """
+
+    def __init__(self, embed_fn, threshold=0.92, ttl=3600, max_entries=500,
+                 version_fn=None, version_check_interval=30):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        self._entries = OrderedDict()  # key -> {"embedding", "answer", "created"}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, query):
+        vector = np.asarray(self.embed_fn([query])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._version_checked_at < self.version_check_interval:
+                return
+            # Claimed: concurrent lookups skip the check instead of waiting on the database
+            self._version_checked_at = now
+        version = self.version_fn()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [k for k, e in self._entries.items() if e["created"] < cutoff]:
+            del self._entries[key]
+
+    def lookup(self, query, embedding=None):
+        """
+        Returns (answer or None, query embedding). Pass the embedding back to store()
+        so the query is embedded only once.
+        """
+        if embedding is None:
+            embedding = self.embed(query)
+        self._check_version()
+        with self._lock:
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None, embedding
+
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[k]["embedding"] for k in keys])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None, embedding
+
+            self._entries.move_to_end(keys[best])
+            self.hits += 1
+            return self._entries[keys[best]]["answer"], embedding
+
+    def store(self, query, answer, embedding=None):
+        if embedding is None:
+            embedding = self.embed(query)
+        with self._lock:
+            self._entries[self._next_key] = {"embedding": embedding, "answer": answer, "created": time.monotonic()}
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,344 @@
+"""
+Headless asyncio HTTP API for EduBot (for the school portal and the WhatsApp gateway).
+
+Usage:
+    python api_server.py --port 8080
+    python api_server.py --port 8080 --fake-llm     # load testing without Gemini
+
+Endpoints:
+    POST /chat          {"session_id": "...optional...", "message": "..."} -> JSON answer
+    POST /chat/stream   same body; Server-Sent Events: "delta" events, then one "done" event
+    GET  /metrics       Prometheus text (see metrics.py)
+    GET  /healthz
+
+Blocking work (Mongo, embeddings, Gemini streaming) runs on a bounded thread pool. Gemini calls
+are capped by LLM_MAX_CONCURRENCY; when LLM_MAX_WAITING requests are already queued behind
+that cap, new requests get HTTP 503 with Retry-After instead of piling up.
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import metrics
+import rag_engine as rag
+from context_builder import build_context
+from conversation import Conversation
+from prompts import SYSTEM_INSTRUCTIONS
+
+API_BLOCKING_WORKERS = int(os.getenv("API_BLOCKING_WORKERS", "64"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", "256"))
+SESSION_TTL = float(os.getenv("API_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "10000"))
+MAX_MESSAGE_CHARS = 2000
+
+
+class Overloaded(Exception):
+    pass
+
+
+# ==========================================
+# 1. CONCURRENCY CONTROL
+# ==========================================
+class LLMGate:
+    """Caps concurrent Gemini calls and rejects new work once too many callers are queued."""
+
+    def __init__(self, max_concurrency, max_waiting):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+
+    def is_full(self):
+        return self.semaphore.locked() and self.waiting >= self.max_waiting
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self.is_full():
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+
+class Session:
+    def __init__(self, model):
+        self.conversation = Conversation(model)
+        # Turns within one session are answered in order
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """In-memory per-session conversation state with idle expiry and a size cap (oldest evicted)."""
+
+    def __init__(self, model, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.model = model
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def get(self, session_id):
+        session = self.sessions.pop(session_id, None) or Session(self.model)
+        session.last_used = time.monotonic()
+        self.sessions[session_id] = session
+
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and oldest.last_used >= cutoff:
+                break
+            if oldest.lock.locked():
+                break
+            del self.sessions[oldest_id]
+        return session
+
+
+# ==========================================
+# 2. CHAT SERVICE
+# ==========================================
+class EduBotService:
+    def __init__(self, model, blocking_workers=API_BLOCKING_WORKERS,
+                 llm_max_concurrency=LLM_MAX_CONCURRENCY, llm_max_waiting=LLM_MAX_WAITING):
+        self.sessions = SessionStore(model)
+        self.gate = LLMGate(llm_max_concurrency, llm_max_waiting)
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="api-blocking")
+
+    async def run_blocking(self, fn, *args):
+        # Copy the context so stage timings reach the request trace
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, fn, *args)
+
+    async def iterate_in_thread(self, iterable):
+        """
+        Consumes a blocking iterator (the Gemini stream) on the pool and yields its items here.
+        If the consumer stops early (client disconnected, task cancelled), the pump stops at the
+        next item and this only returns once it has, so a caller holding an LLMGate slot keeps
+        it until the Gemini stream is no longer being read.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def pump():
+            iterator = iter(iterable)
+            try:
+                for item in iterator:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                else:
+                    loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if cancelled.is_set() and close is not None:
+                    close()
+
+        pump_future = loop.run_in_executor(self.executor, contextvars.copy_context().run, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            # Shielded: cancelling the request must not cancel the wait for the pump thread
+            with contextlib.suppress(Exception):
+                await asyncio.shield(pump_future)
+
+    async def answer(self, session_id, message, on_delta=None):
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            trace = metrics.start_trace("api")
+            trace.attach(query=message)
+            try:
+                result = await self._answer(session, message, on_delta, trace)
+                trace.attach(answer=result["answer"])
+                trace.finish()
+                return result
+            except Overloaded:
+                trace.finish(status="rejected")
+                raise
+            except Exception as e:
+                trace.finish(status="error", error=e)
+                raise
+
+    async def _answer(self, session, message, on_delta, trace):
+        student_name = await self.run_blocking(rag.extract_student_name, message)
+        trace.attach(student=student_name)
+
+        # Exact lookups are answered from Mongo without the LLM (general questions only)
+        if not student_name:
+            fast_answer = await self.run_blocking(rag.answer_fast_path, message)
+            if fast_answer is not None:
+                session.conversation.record(message, fast_answer["answer"])
+                trace.set(student_query=False, cache_hit=False, fast_path=fast_answer["rule"])
+                if on_delta:
+                    await on_delta(fast_answer["answer"])
+                return {"answer": fast_answer["answer"], "cached": False, "fast_path": fast_answer["rule"],
+                        "request_id": trace.request_id}
+
+        # General questions may already have a cached answer (never for student records)
+        query_embedding = None
+        if not student_name:
+            cached_answer, query_embedding = await self.run_blocking(rag.get_answer_cache().lookup, message)
+            if cached_answer is not None:
+                session.conversation.record(message, cached_answer)
+                trace.set(student_query=False, cache_hit=True)
+                if on_delta:
+                    await on_delta(cached_answer)
+                return {"answer": cached_answer, "cached": True, "request_id": trace.request_id}
+        trace.set(student_query=bool(student_name), cache_hit=False)
+
+        retrieved = await self.run_blocking(
+            functools.partial(rag.retrieve_context, message, student_name, query_embedding=query_embedding))
+        with metrics.timed("prompt_assembly"):
+            full_context, context_details = build_context(message, retrieved)
+        trace.set(intents=context_details["intents"], context_tokens=context_details["tokens"],
+                  chunk_ids=context_details["chunk_ids"], unavailable=list(retrieved["unavailable"]))
+
+        async with self.gate.slot():
+            reply = session.conversation.stream_reply(message, full_context, student_name)
+            chunks = self.iterate_in_thread(reply)
+            try:
+                async for chunk in chunks:
+                    if on_delta:
+                        await on_delta(chunk)
+            finally:
+                # A failed on_delta (client gone) leaves the generator suspended; close it here so
+                # the pump has stopped before the slot is released
+                await chunks.aclose()
+        metrics.record_llm(reply, full_context)
+
+        if (not student_name and not session.conversation.has_student_context
+                and retrieved["knowledge_chunks"] and not retrieved["unavailable"]):
+            await self.run_blocking(rag.get_answer_cache().store, message, reply.text, query_embedding)
+
+        return {
+            "answer": reply.text,
+            "cached": False,
+            "request_id": trace.request_id,
+            "time_to_first_token": reply.time_to_first_token,
+            "unavailable": list(retrieved["unavailable"]),
+        }
+
+
+# ==========================================
+# 3. HTTP HANDLERS
+# ==========================================
+async def _read_chat_body(request):
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise web.HTTPBadRequest(text="Body must be JSON")
+    message = str(body.get("message", "")).strip()
+    if not message or len(message) > MAX_MESSAGE_CHARS:
+        raise web.HTTPBadRequest(text=f"'message' must be 1-{MAX_MESSAGE_CHARS} characters")
+    return str(body.get("session_id") or uuid.uuid4().hex), message
+
+
+def _busy_response():
+    return web.json_response({"error": "EduBot is busy, please retry shortly."}, status=503, headers={"Retry-After": "2"})
+
+
+async def handle_chat(request):
+    session_id, message = await _read_chat_body(request)
+    try:
+        result = await request.app["service"].answer(session_id, message)
+    except Overloaded:
+        return _busy_response()
+    return web.json_response({"session_id": session_id, **result})
+
+
+async def handle_chat_stream(request):
+    session_id, message = await _read_chat_body(request)
+    service = request.app["service"]
+    if service.gate.is_full():
+        return _busy_response()
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    async def send(event, data):
+        await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    try:
+        result = await service.answer(session_id, message, on_delta=lambda text: send("delta", {"text": text}))
+        await send("done", {"session_id": session_id, **result})
+    except Overloaded:
+        await send("error", {"error": "EduBot is busy, please retry shortly."})
+    except ConnectionResetError:
+        pass
+    except Exception as e:
+        await send("error", {"error": str(e)})
+    return response
+
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+
+async def handle_health(request):
+    return web.json_response({"status": "ok", "sessions": len(request.app["service"].sessions.sessions)})
+
+
+def create_app(model):
+    app = web.Application()
+    app["service"] = EduBotService(model)
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_post("/chat/stream", handle_chat_stream)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_health)
+    return app
+
+
+def make_model(fake_llm=False):
+    if fake_llm:
+        from benchmarks.fakes import FakeLLM
+        return FakeLLM()
+
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise ValueError("API_KEY not found in environment variables. Please set it before running the application.")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_INSTRUCTIONS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fake-llm", action="store_true", help="Answer with benchmarks.fakes.FakeLLM instead of Gemini")
+    args = parser.parse_args()
+
+    model = make_model(args.fake_llm)
+    print("Loading knowledge base and embedding model...")
+    rag.warmup()
+    metrics.configure_request_log()
+    web.run_app(create_app(model), host=args.host, port=args.port)
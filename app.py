@@ -1,10 +1,13 @@
+import uuid
 import streamlit as st
 import google.generativeai as genai
 import rag_engine as rag
-import time
+from conversation import Conversation
+from context_builder import build_context
+from tts import SpeechService
+from transcript_store import SessionTranscript, TranscriptRegistry, make_store
+import metrics
 from streamlit_mic_recorder import speech_to_text
-from gtts import gTTS
-from io import BytesIO
 from dotenv import load_dotenv
 import os
 load_dotenv()
@@ -27,9 +30,6 @@ st.set_page_config(
 
 genai.configure(api_key=API_KEY)
 
-# Initialize Model
-model = genai.GenerativeModel('gemini-2.0-flash')
-
 # Updated System Prompt
 SYSTEM_INSTRUCTIONS = """
 You are "EduBot," a warm, empathetic, and professional school counselor assistant. 
@@ -41,37 +41,49 @@ CORE BEHAVIORS:
 3. **Strict Context:** Answer strictly using the provided Context.
 """
 
+# Initialize Model (system instructions are attached once, not repeated in every turn)
+model = genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_INSTRUCTIONS)
+
+@st.cache_resource(show_spinner="Loading school knowledge base...")
+def warm_up_rag():
+    # Runs once per server process; every session and rerun reuses the loaded resources
+    rag.warmup()
+    metrics.start_exporters()
+    return True
+
+warm_up_rag()
+
 # ==========================================
 # 2. SESSION STATE
 # ==========================================
-if "messages" not in st.session_state:
-    st.session_state.messages = [
-        {"role": "assistant", "content": "Namaste! I am EduBot. How can I help you today?"}
-    ]
+@st.cache_resource
+def get_transcript_store():
+    # Older messages of every session are spilled here (see transcript_store.py)
+    return make_store()
+
+@st.cache_resource
+def get_transcript_registry():
+    # Enforces the memory cap across all sessions in this server process
+    return TranscriptRegistry()
+
+if "transcript" not in st.session_state:
+    # Only the recent window of the chat lives in session state
+    st.session_state.transcript = SessionTranscript(uuid.uuid4().hex, get_transcript_store(), get_transcript_registry())
+    st.session_state.transcript.append("assistant", "Namaste! I am EduBot. How can I help you today?")
+    st.session_state.older_pages = 0
 
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = model.start_chat(history=[])
+if "conversation" not in st.session_state:
+    st.session_state.conversation = Conversation(model)
 
 # ==========================================
 # 3. HELPER FUNCTIONS
 # ==========================================
-def extract_potential_student_names(query):
-    known_students = ["Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", 
-                      "Ayaan", "Krishna", "Ishaan", "Diya", "Saanvi", "Ananya", "Aadhya", 
-                      "Pari", "Kiara", "Myra", "Riya", "Anvi", "Fatima"]
-    found_names = [name for name in known_students if name.lower() in query.lower()]
-    return found_names[0] if found_names else None
-
-def text_to_audio(text):
-    """
-    Converts text to audio bytes using Google TTS (Indian Accent).
-    """
-    sound_file = BytesIO()
-    # 'en' with tld='co.in' gives a nice Indian English accent
-    # You can change lang='hi' if you want pure Hindi
-    tts = gTTS(text, lang='en', tld='co.in')
-    tts.write_to_fp(sound_file)
-    return sound_file
+@st.cache_resource
+def get_speech_service():
+    # One TTS worker pool and disk cache shared by every session
+    return SpeechService()
+
+speech = get_speech_service()
 
 # ==========================================
 # 4. UI LAYOUT
@@ -88,13 +100,33 @@ voice_text = speech_to_text(
     key='STT'
 )
 
-# Display Chat History
-for message in st.session_state.messages:
+def render_message(message, autoload_audio=False):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        # If there is saved audio for this message, play it
-        if "audio" in message:
-            st.audio(message["audio"], format="audio/mp3")
+        if not message.get("audio_key"):
+            return
+        # Audio bytes are read only for the latest answer or when asked for, never for the whole history
+        if autoload_audio or st.button("🔊 Play", key=f"play_{message['seq']}"):
+            audio_data = speech.load(message.get("audio_key"))
+            if audio_data is None:
+                # Evicted from the audio cache: synthesize it again
+                audio_data = speech.load(speech.speak(message["content"]))
+            if audio_data:
+                st.audio(audio_data, format="audio/mp3")
+
+# Display Chat History: spilled messages are read back from the store only when requested
+transcript = st.session_state.transcript
+if transcript.first_recent_seq > 0:
+    if st.button("Show earlier messages", key="older"):
+        st.session_state.older_pages += 1
+    if st.session_state.older_pages:
+        older = transcript.load_older(limit=st.session_state.older_pages * transcript.window)
+        for message in older:
+            render_message(message)
+
+recent = transcript.recent()
+for message in recent:
+    render_message(message, autoload_audio=message is recent[-1])
 
 # ==========================================
 # 5. CHAT LOGIC
@@ -112,39 +144,42 @@ if prompt:
     # 1. Display User Message
     with st.chat_message("user"):
         st.markdown(prompt)
-    st.session_state.messages.append({"role": "user", "content": prompt})
-
-    # 2. RAG Retrieval
-    context_pieces = []
-    
-    with st.spinner("Searching school records..."):
-        # A. General Search
-        general_info = rag.search_general_knowledge(prompt)
-        if general_info:
-            context_pieces.append(f"📚 SCHOOL KNOWLEDGE BASE:\n{general_info}")
-
-        # B. Student Search (FIXED LOGIC)
-        potential_name = extract_potential_student_names(prompt)
-        if potential_name:
-            student_record = rag.get_student_info(potential_name) # Pass Name Only
-            
-            if student_record and "SYSTEM_MESSAGE" in student_record:
-                context_pieces.append(f"⚠️ SYSTEM ALERT: {student_record}")
-            elif student_record:
-                context_pieces.append(f"👤 STUDENT RECORD:\n{student_record}")
-
-    # 3. Construct Final Prompt
-    full_context = "\n\n".join(context_pieces)
+    transcript.append("user", prompt)
+    trace = metrics.start_trace("streamlit")
+    trace.attach(query=prompt)
+
+    # 2. Fast path for exact lookups, then the Semantic Answer Cache (general questions only, never student records)
+    potential_name = rag.extract_student_name(prompt)
+    trace.attach(student=potential_name)
+    fast_answer = None
+    cached_answer = None
+    query_embedding = None
+    if not potential_name:
+        fast_answer = rag.answer_fast_path(prompt)
+        if fast_answer is None:
+            with metrics.timed("answer_cache_lookup"):
+                cached_answer, query_embedding = rag.get_answer_cache().lookup(prompt)
+    direct_answer = fast_answer["answer"] if fast_answer else cached_answer
+    trace.set(student_query=bool(potential_name), cache_hit=cached_answer is not None,
+              fast_path=fast_answer["rule"] if fast_answer else None)
+
+    # 3. RAG Retrieval
+    full_context = ""
+    retrieved = {"knowledge_chunks": [], "student_record": None, "unavailable": {}}
     
-    final_prompt = f"""
-    {SYSTEM_INSTRUCTIONS}
+    if direct_answer is None:
+        with st.spinner("Searching school records..."):
+            # A. General Search and B. Student Search run concurrently
+            retrieved = rag.retrieve_context(prompt, potential_name, query_embedding=query_embedding)
 
-    CONTEXT FOUND IN DATABASE:
-    {full_context}
+            # Only the sections relevant to the question, within the token budget
+            with metrics.timed("prompt_assembly"):
+                full_context, context_details = build_context(prompt, retrieved)
+            trace.set(intents=context_details["intents"], context_tokens=context_details["tokens"],
+                      chunk_ids=context_details["chunk_ids"], unavailable=list(retrieved["unavailable"]))
 
-    USER QUERY:
-    {prompt}
-    """
+            if retrieved["unavailable"]:
+                st.caption(f"Some sources were unavailable: {', '.join(retrieved['unavailable'])}")
 
     # 4. Generate Response
     with st.chat_message("assistant"):
@@ -152,26 +187,44 @@ if prompt:
         full_response = ""
         
         try:
-            response = st.session_state.chat_session.send_message(final_prompt)
-            
-            # Text Animation
-            for chunk in response.text.split():
-                full_response += chunk + " "
-                time.sleep(0.05)
-                message_placeholder.markdown(full_response + "▌")
-            message_placeholder.markdown(full_response)
+            if direct_answer is not None:
+                full_response = direct_answer
+                message_placeholder.markdown(full_response)
+                st.session_state.conversation.record(prompt, full_response)
+                with metrics.timed("tts"):
+                    audio_key = speech.speak(full_response)
+            else:
+                reply = st.session_state.conversation.stream_reply(prompt, full_context, potential_name)
+                # Sentences are synthesized on TTS workers while the rest is still generating
+                speech_pipeline = speech.pipeline()
+
+                # Render chunks as Gemini produces them
+                for chunk in reply:
+                    full_response += chunk
+                    speech_pipeline.feed(chunk)
+                    message_placeholder.markdown(full_response + "▌")
+                message_placeholder.markdown(full_response)
+                metrics.record_llm(reply, full_context)
+
+                # Only answers grounded purely in the knowledge base (no student anywhere in the history) are reusable
+                if (not potential_name and not st.session_state.conversation.has_student_context
+                        and retrieved["knowledge_chunks"] and not retrieved["unavailable"]):
+                    rag.get_answer_cache().store(prompt, full_response, query_embedding)
+
+                with metrics.timed("tts"):
+                    audio_key = speech_pipeline.finish()
             
-            # --- 🔊 NEW: GENERATE AUDIO ---
-            # We generate audio for the final response
-            audio_data = text_to_audio(full_response)
-            st.audio(audio_data, format="audio/mp3")
+            # --- 🔊 AUDIO ---
+            # Played once the stream has completed; repeated answers come straight from the disk cache
+            audio_data = speech.load(audio_key)
+            if audio_data:
+                st.audio(audio_data, format="audio/mp3")
             
-            # Save to history so it persists
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": full_response,
-                "audio": audio_data # Store audio to replay if needed
-            })
+            # Save to history so it persists (only the cache key, not the audio bytes)
+            transcript.append("assistant", full_response, audio_key)
+            trace.attach(answer=full_response)
+            trace.finish()
         
         except Exception as e:
+            trace.finish(status="error", error=e)
             st.error(f"An error occurred: {e}")
\ No newline at end of file
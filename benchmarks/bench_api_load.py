@@ -0,0 +1,82 @@
+"""
+Load test for api_server.py: N concurrent parent sessions, each sending M messages.
+
+Usage:
+    python api_server.py --port 8080 --fake-llm &
+    python benchmarks/bench_api_load.py --url http://localhost:8080 --sessions 300 --messages 5
+    python benchmarks/bench_api_load.py --stream       # use the SSE endpoint instead
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import aiohttp
+
+MESSAGES = [
+    "What is the fee structure for grade 8?",
+    "When are the half-yearly exams?",
+    "What is the late fee?",
+    "Which bus goes to Green Valley?",
+    "How is Aarav doing in Mathematics?",
+    "What is Diya's attendance?",
+    "Show me the grade 7 timetable for Monday",
+]
+
+
+async def one_session(http, args, latencies, first_tokens, status_counts):
+    session_id = uuid.uuid4().hex
+    for _ in range(args.messages):
+        payload = {"session_id": session_id, "message": random.choice(MESSAGES)}
+        start = time.perf_counter()
+        endpoint = "/chat/stream" if args.stream else "/chat"
+        async with http.post(args.url + endpoint, json=payload) as response:
+            status_counts[response.status] = status_counts.get(response.status, 0) + 1
+            if response.status != 200:
+                await response.read()
+                continue
+            if args.stream:
+                first = None
+                async for line in response.content:
+                    if first is None and line.startswith(b"event: delta"):
+                        first = time.perf_counter() - start
+                if first is not None:
+                    first_tokens.append(first)
+            else:
+                await response.json()
+        latencies.append(time.perf_counter() - start)
+
+
+def pct(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else float("nan")
+
+
+async def main(args):
+    latencies, first_tokens, status_counts = [], [], {}
+    connector = aiohttp.TCPConnector(limit=args.sessions)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(one_session(http, args, latencies, first_tokens, status_counts)
+                               for _ in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+    print("----------------------------------------------------------------")
+    print(f"{args.sessions} sessions x {args.messages} messages in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.1f} answers/s)")
+    print(f"HTTP status counts: {status_counts}")
+    print(f"latency ms      p50 {pct(latencies, .5):.0f}  p95 {pct(latencies, .95):.0f}  p99 {pct(latencies, .99):.0f}")
+    if first_tokens:
+        print(f"first delta ms  p50 {pct(first_tokens, .5):.0f}  p95 {pct(first_tokens, .95):.0f}  p99 {pct(first_tokens, .99):.0f}")
+    print("----------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--stream", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,137 @@
+"""
+Compares the embedding backends (see embeddings.py) on parity, latency and memory.
+
+Usage:
+    python embeddings.py export                                  # once, for the ONNX backends
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --backends sentence-transformers onnx-int8 --k 5
+
+Every backend runs in a fresh interpreter, so load time and resident memory are its own.
+Parity is measured against the first backend (the PyTorch reference): per-text cosine between
+the two embeddings of the same text, and top-k overlap of knowledge-base retrieval for a set
+of parent questions. Needs the local Mongo that ingest_knowledge.py reads.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import rag_engine as rag  # noqa: E402
+from ingest_knowledge import iter_knowledge_chunks  # noqa: E402
+
+QUERIES = [
+    "What is the fee structure for grade 8?",
+    "What is the late fee?",
+    "What is the uniform on Wednesday?",
+    "When does the Route_03 bus leave?",
+    "Who drives the bus to Sector 15?",
+    "When are the half-yearly exams?",
+    "Is school closed on Diwali?",
+    "What is the minimum attendance to pass?",
+    "Which chapters are in grade 9 science?",
+    "Grade 10 timetable for Friday",
+    "When is the annual sports day?",
+    "How much are the lab charges?",
+    "कक्षा 8 की फीस कितनी है?",
+    "bus ka time kya hai route 5 ka?",
+]
+
+PROBE = r"""
+import json, resource, sys, time
+import numpy as np
+from embeddings import make_embed_fn
+
+backend, texts_path, out_path = sys.argv[1:4]
+with open(texts_path) as f:
+    data = json.load(f)
+
+start = time.perf_counter()
+embed = make_embed_fn(backend)
+embed(["warmup"])
+load_s = time.perf_counter() - start
+
+single = []
+for query in data["queries"] * 5:
+    t = time.perf_counter()
+    embed([query])
+    single.append(time.perf_counter() - t)
+
+t = time.perf_counter()
+chunk_vectors = []
+for i in range(0, len(data["chunks"]), 32):
+    chunk_vectors.extend(embed(data["chunks"][i:i + 32]))
+batch_s = time.perf_counter() - t
+
+np.savez(out_path, queries=np.asarray(embed(data["queries"]), dtype=np.float32),
+         chunks=np.asarray(chunk_vectors, dtype=np.float32))
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({
+    "load_s": load_s,
+    "single_p50_ms": float(np.percentile(single, 50) * 1000),
+    "single_p95_ms": float(np.percentile(single, 95) * 1000),
+    "chunks_per_s": len(data["chunks"]) / batch_s,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+}))
+"""
+
+
+def run_backend(backend, texts_path, workdir):
+    out_path = os.path.join(workdir, f"{backend}.npz")
+    result = subprocess.run([sys.executable, "-c", PROBE, backend, texts_path, out_path], cwd=REPO_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{backend} failed:\n{result.stderr.strip()}")
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    vectors = np.load(out_path)
+    return stats, vectors["queries"], vectors["chunks"]
+
+
+def parity(reference, candidate, k):
+    ref_q, ref_c = reference
+    cand_q, cand_c = candidate
+    cosines = np.concatenate([(ref_c * cand_c).sum(axis=1), (ref_q * cand_q).sum(axis=1)])
+    ref_top = np.argsort(-(ref_q @ ref_c.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_q @ cand_c.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+    return {"cosine_mean": float(cosines.mean()), "cosine_min": float(cosines.min()), "topk_overlap": float(np.mean(overlap))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["sentence-transformers", "onnx", "onnx-int8"],
+                        help="The first one is the parity reference")
+    parser.add_argument("--k", type=int, default=10, help="Top-k for the retrieval overlap")
+    args = parser.parse_args()
+
+    chunks = [chunk["text"] for chunk in iter_knowledge_chunks(rag.get_mongo_db())]
+    workdir = tempfile.mkdtemp(prefix="bench_embed_")
+    texts_path = os.path.join(workdir, "texts.json")
+    with open(texts_path, "w") as f:
+        json.dump({"queries": QUERIES, "chunks": chunks}, f)
+    print(f"{len(chunks)} knowledge chunks, {len(QUERIES)} queries")
+
+    results = {backend: run_backend(backend, texts_path, workdir) for backend in args.backends}
+    reference = results[args.backends[0]]
+
+    print("----------------------------------------------------------------")
+    print(f"{'backend':<22}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'chunks/s':>10}{'RSS MB':>9}"
+          f"{'cos mean':>10}{'cos min':>9}{f'top{args.k}':>8}")
+    for backend, (stats, queries, chunk_vectors) in results.items():
+        match = parity(reference[1:], (queries, chunk_vectors), args.k)
+        print(f"{backend:<22}{stats['load_s']:>8.2f}{stats['single_p50_ms']:>9.2f}{stats['single_p95_ms']:>9.2f}"
+              f"{stats['chunks_per_s']:>10.0f}{stats['peak_rss_mb']:>9.0f}"
+              f"{match['cosine_mean']:>10.4f}{match['cosine_min']:>9.4f}{match['topk_overlap']:>8.2f}")
+    print("----------------------------------------------------------------")
+    print(f"Parity is against {args.backends[0]}. Re-ingest (python ingest_knowledge.py --full) after switching "
+          "EMBED_BACKEND if cosine agreement is not ~1.0.")
+
+
+if __name__ == "__main__":
+    main()
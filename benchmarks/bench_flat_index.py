@@ -0,0 +1,183 @@
+"""
+Compares the flat memory-mapped index (flat_index.py) with Chroma on recall, query latency and
+cold start, with and without metadata filters.
+
+Usage:
+    python benchmarks/bench_flat_index.py                        # the real knowledge base
+    python benchmarks/bench_flat_index.py --synthetic 50000      # random corpus, to see how it scales
+    python benchmarks/bench_flat_index.py --k 5 --queries 500
+
+Both backends get the same normalized vectors and metadata, written to a temporary Chroma
+PersistentClient and a temporary flat index. Recall@k is measured against exact brute force, so
+the flat index should score 1.0 and Chroma shows what HNSW approximation costs. Cold start (open
+the store and answer one query) runs in a fresh interpreter per backend. The real corpus needs
+the local Mongo that ingest_knowledge.py reads.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import flat_index  # noqa: E402
+
+DIM = 384
+CATEGORIES = ["policies", "calendar", "transport", "syllabus", "timetable", "exams"]
+
+COLD_START = r"""
+import json, resource, sys, time
+import numpy as np
+backend, path, query_path = sys.argv[1:4]
+query = np.load(query_path).tolist()
+
+start = time.perf_counter()
+if backend == "chroma":
+    import chromadb
+    collection = chromadb.PersistentClient(path=path).get_collection("bench")
+else:
+    from flat_index import FlatVectorIndex
+    collection = FlatVectorIndex(path)
+collection.query(query_embeddings=[query], n_results=10)
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({"cold_s": time.perf_counter() - start,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale}))
+"""
+
+
+# ==========================================
+# 1. CORPUS
+# ==========================================
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def real_corpus():
+    import rag_engine as rag
+    from ingest_knowledge import iter_knowledge_chunks
+
+    chunks = {chunk["id"]: chunk for chunk in iter_knowledge_chunks(rag.get_mongo_db())}.values()
+    ids = [chunk["id"] for chunk in chunks]
+    texts = [chunk["text"] for chunk in chunks]
+    metadatas = [chunk["metadata"] for chunk in chunks]
+    embed = rag.get_embed_fn()
+    vectors = np.concatenate([normalize(embed(texts[i:i + 256])) for i in range(0, len(texts), 256)])
+    return ids, texts, metadatas, vectors
+
+
+def synthetic_corpus(size, rng):
+    # Clustered, like real embeddings: every chunk is a noisy copy of one of size / 20 topic vectors
+    centers = normalize(rng.standard_normal((max(size // 20, 1), DIM)))
+    vectors = normalize(centers[rng.integers(len(centers), size=size)] + 0.03 * rng.standard_normal((size, DIM)))
+    metadatas = [{"category": random.choice(CATEGORIES), "grade": random.randint(1, 12)} for _ in range(size)]
+    ids = [f"chunk-{i}" for i in range(size)]
+    return ids, [f"synthetic chunk {i}" for i in range(size)], metadatas, vectors
+
+
+def make_queries(vectors, count, rng):
+    # Perturbed corpus vectors: realistic neighbourhoods without needing real questions
+    picks = vectors[rng.integers(len(vectors), size=count)]
+    return normalize(picks + 0.03 * rng.standard_normal(picks.shape))
+
+
+# ==========================================
+# 2. MEASUREMENT
+# ==========================================
+def exact_top_k(vectors, metadatas, query, k, where):
+    rows = np.arange(len(vectors))
+    if where:
+        (field, value), = where.items()
+        rows = np.array([i for i, m in enumerate(metadatas) if m.get(field) == value], dtype=int)
+    scores = vectors[rows] @ query
+    return {rows[i] for i in np.argsort(-scores)[:k]}
+
+
+def run_queries(collection, queries, k, where):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, where=where)
+        latencies.append(time.perf_counter() - start)
+        results.append(result["ids"][0])
+    return latencies, results
+
+
+def cold_start(backend, path, query_path):
+    result = subprocess.run([sys.executable, "-c", COLD_START, backend, path, query_path], cwd=REPO_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{backend} cold start failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Random corpus of this many chunks instead of the real one")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import chromadb
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    ids, texts, metadatas, vectors = synthetic_corpus(args.synthetic, rng) if args.synthetic else real_corpus()
+    queries = make_queries(vectors, args.queries, rng)
+    print(f"{len(ids)} chunks, {len(queries)} queries, k={args.k}")
+
+    workdir = tempfile.mkdtemp(prefix="bench_flat_")
+    chroma_path, flat_path = os.path.join(workdir, "chroma"), os.path.join(workdir, "flat")
+
+    start = time.perf_counter()
+    chroma = chromadb.PersistentClient(path=chroma_path).get_or_create_collection("bench")
+    for i in range(0, len(ids), 5000):
+        chroma.add(ids=ids[i:i + 5000], documents=texts[i:i + 5000], metadatas=metadatas[i:i + 5000],
+                   embeddings=vectors[i:i + 5000].tolist())
+    chroma_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flat_index.write_index(flat_path, ids, texts, metadatas, vectors)
+    flat = flat_index.FlatVectorIndex(flat_path)
+    flat_build = time.perf_counter() - start
+
+    # Filter values taken from the corpus, so every filtered query has candidates
+    filters = [None, {"category": metadatas[0]["category"]}]
+    grades = [m["grade"] for m in metadatas if "grade" in m]
+    if grades:
+        filters.append({"grade": max(set(grades), key=grades.count)})
+
+    index_ids = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    print("----------------------------------------------------------------")
+    print(f"{'backend':<10}{'filter':<28}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for where in filters:
+        truth = [exact_top_k(vectors, metadatas, q, args.k, where) for q in queries]
+        for name, collection in (("chroma", chroma), ("flat", flat)):
+            run_queries(collection, queries[:10], args.k, where)  # warm caches
+            latencies, results = run_queries(collection, queries, args.k, where)
+            recall = np.mean([len({index_ids[r] for r in got} & want) / max(len(want), 1)
+                              for got, want in zip(results, truth)])
+            print(f"{name:<10}{json.dumps(where) if where else '-':<28}{recall:>8.3f}"
+                  f"{np.percentile(latencies, 50) * 1000:>9.2f}{np.percentile(latencies, 95) * 1000:>9.2f}")
+
+    query_path = os.path.join(workdir, "query.npy")
+    np.save(query_path, queries[0])
+    print("----------------------------------------------------------------")
+    print(f"{'backend':<10}{'build s':>9}{'cold s':>9}{'RSS MB':>9}")
+    for name, path, build in (("chroma", chroma_path, chroma_build), ("flat", flat_path, flat_build)):
+        stats = cold_start(name, path, query_path)
+        print(f"{name:<10}{build:>9.2f}{stats['cold_s']:>9.3f}{stats['peak_rss_mb']:>9.0f}")
+    print("----------------------------------------------------------------")
+    print(f"Stores left in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
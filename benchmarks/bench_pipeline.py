@@ -0,0 +1,272 @@
+"""
+Offline end-to-end benchmark of the RAG pipeline:
+name extraction -> hybrid knowledge search -> student lookup -> prompt assembly -> LLM -> TTS.
+
+Usage:
+    python benchmarks/bench_pipeline.py --students 20 1000 10000 --sessions 1 8 32
+    python benchmarks/bench_pipeline.py --mongo-uri mongodb://localhost:27017/ --students 100000
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline-<previous>.json
+
+Stand-ins: mongomock (or a local mongod via --mongo-uri), an in-memory Chroma collection with a
+deterministic hash embedding, a fake streaming LLM with configurable latency, and the offline
+'silent' TTS backend. Results are written as JSON so runs can be compared.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag_engine as rag  # noqa: E402
+import seed_databse as seed  # noqa: E402
+from benchmarks.fakes import FakeLLM, HashEmbeddingFunction  # noqa: E402
+from bm25_index import BM25Index, build_bm25  # noqa: E402
+from context_builder import build_context  # noqa: E402
+from conversation import Conversation  # noqa: E402
+from ingest_knowledge import ingest, iter_knowledge_chunks  # noqa: E402
+from migrate_db import ensure_indexes  # noqa: E402
+from name_resolver import StudentNameResolver  # noqa: E402
+from student_digest import DigestRefresher  # noqa: E402
+from tts import AudioCache, SilentBackend, SpeechService  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+STAGES = ["name_extraction", "vector_search", "student_lookup", "prompt_assembly",
+          "llm_first_token", "llm_total", "tts", "total"]
+
+
+# ==========================================
+# 1. DATASET & STAND-INS
+# ==========================================
+def make_db(mongo_uri, db_name):
+    if mongo_uri:
+        import pymongo
+        return pymongo.MongoClient(mongo_uri)[db_name]
+    import mongomock
+    return mongomock.MongoClient()[db_name]
+
+
+def generate_dataset(db, num_students, batch_size=5000):
+    """Same schema as seed_databse.py, scaled to `num_students` spread over grades 6-10."""
+    for name in ("students", "academic_records", "curriculum", "school_info", "student_digest", "digest_state"):
+        db[name].drop()
+    db.school_info.insert_many(seed.build_school_info())
+    db.curriculum.insert_many([seed.build_curriculum(g) for g in range(6, 11)])
+
+    full_names = []
+    students, records = [], []
+    for counter in range(1, num_students + 1):
+        s_id = f"STU_{counter:06d}"
+        fname, lname = random.choice(seed.names), random.choice(seed.surnames)
+        students.append(seed.build_student(s_id, fname, lname, 6 + counter % 5))
+        records.append(seed.build_academic_record(s_id))
+        full_names.append(f"{fname} {lname}")
+        if len(students) >= batch_size:
+            db.students.insert_many(students, ordered=False)
+            db.academic_records.insert_many(records, ordered=False)
+            students, records = [], []
+    if students:
+        db.students.insert_many(students, ordered=False)
+        db.academic_records.insert_many(records, ordered=False)
+    ensure_indexes(db)
+    DigestRefresher(db).rebuild()
+    return full_names
+
+
+def make_vector_collection(db, embed_fn):
+    import chromadb
+    client = chromadb.EphemeralClient()
+    name = f"bench_{int(time.time() * 1000)}"
+    collection = client.get_or_create_collection(name=name, embedding_function=embed_fn)
+    ingest(db, collection, embed_fn)
+    return collection
+
+
+def make_queries(full_names, count):
+    general = [
+        "What is the fee structure for grade 8?",
+        "What is the late fee?",
+        "What is the uniform on Wednesday?",
+        "When does the Route_03 bus leave?",
+        "When are the half-yearly exams?",
+        "Is school closed on Diwali?",
+    ]
+    student = [
+        "How is {name} doing in Mathematics?",
+        "What is {first}'s attendance?",
+        "Show me {name}'s timetable for Monday",
+        "Does {name} have pending homework?",
+    ]
+    queries = []
+    for _ in range(count):
+        if random.random() < 0.5:
+            queries.append(random.choice(general))
+        else:
+            name = random.choice(full_names)
+            queries.append(random.choice(student).format(name=name, first=name.split(" ")[0]))
+    return queries
+
+
+# ==========================================
+# 2. MEASUREMENT
+# ==========================================
+def run_query(query, conversation, speech):
+    timings = {}
+    start = time.perf_counter()
+
+    t = time.perf_counter()
+    student_name = rag.extract_student_name(query)
+    timings["name_extraction"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    chunks = rag.search_knowledge(query)
+    # Hybrid (vector + BM25) now; the stage keeps its name so older result files still compare
+    timings["vector_search"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    record = rag.fetch_student_record(student_name) if student_name else None
+    timings["student_lookup"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    context, _ = build_context(query, {"knowledge_chunks": chunks, "student_record": record, "unavailable": {}})
+    timings["prompt_assembly"] = time.perf_counter() - t
+
+    reply = conversation.stream_reply(query, context)
+    pipeline = speech.pipeline()
+    for chunk in reply:
+        pipeline.feed(chunk)
+    timings["llm_first_token"] = reply.time_to_first_token or 0.0
+    timings["llm_total"] = reply.total_time
+
+    t = time.perf_counter()
+    pipeline.finish()
+    timings["tts"] = time.perf_counter() - t
+
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def run_load(queries, sessions, llm, speech):
+    """Runs `queries` split across `sessions` concurrent conversations."""
+    per_stage = {stage: [] for stage in STAGES}
+    lock = threading.Lock()
+
+    def session_worker(session_queries):
+        conversation = Conversation(llm)
+        for query in session_queries:
+            timings = run_query(query, conversation, speech)
+            with lock:
+                for stage, value in timings.items():
+                    per_stage[stage].append(value)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session_worker, [queries[i::sessions] for i in range(sessions)]))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "sessions": sessions,
+        "queries": len(queries),
+        "throughput_qps": len(queries) / elapsed,
+        "stages": {stage: percentiles(values) for stage, values in per_stage.items() if values},
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+# ==========================================
+# 3. REPORTING
+# ==========================================
+def print_report(result):
+    print(f"\n=== {result['students']} students ===")
+    for load in result["runs"]:
+        print(f"-- {load['sessions']} session(s): {load['throughput_qps']:.1f} queries/s")
+        print(f"   {'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in load["stages"].items():
+            print(f"   {stage:<18}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"   peak RSS: {result['peak_rss_mb']:.0f} MB")
+
+
+def print_comparison(current, previous):
+    print("\n=== p95 change vs previous run ===")
+    old = {(r["students"], l["sessions"]): l for r in previous["results"] for l in r["runs"]}
+    for result in current["results"]:
+        for load in result["runs"]:
+            before = old.get((result["students"], load["sessions"]))
+            if not before:
+                continue
+            for stage, stats in load["stages"].items():
+                prev = before["stages"].get(stage, {}).get("p95_ms")
+                if prev:
+                    change = (stats["p95_ms"] - prev) / prev * 100
+                    print(f"{result['students']:>7} students x{load['sessions']:<3} {stage:<18}{prev:>9.2f} -> {stats['p95_ms']:>9.2f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, nargs="+", default=[20, 1000, 10000])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--mongo-uri", help="Use a local mongod instead of mongomock")
+    parser.add_argument("--db", default="school_rag_bench")
+    parser.add_argument("--llm-first-token", type=float, default=0.4, help="Fake LLM latency to first chunk (s)")
+    parser.add_argument("--llm-chunk", type=float, default=0.03, help="Fake LLM latency between chunks (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/pipeline-<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous result file to diff p95 latencies against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    embed_fn = HashEmbeddingFunction()
+    llm = FakeLLM(first_token_latency=args.llm_first_token, chunk_latency=args.llm_chunk)
+    speech = SpeechService(SilentBackend(), AudioCache(tempfile.mkdtemp(prefix="bench_tts_")))
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "results": []}
+    for num_students in args.students:
+        db = make_db(args.mongo_uri, args.db)
+        start = time.perf_counter()
+        full_names = generate_dataset(db, num_students)
+        collection = make_vector_collection(db, embed_fn)
+        rag.configure(mongo_db=db, embed_fn=embed_fn, vector_collection=collection,
+                      bm25_index=BM25Index(data=build_bm25(iter_knowledge_chunks(db))),
+                      name_resolver=StudentNameResolver(db.students))
+        rag.get_name_resolver().refresh()
+        print(f"Prepared {num_students} students in {time.perf_counter() - start:.1f}s")
+
+        queries = make_queries(full_names, args.queries)
+        result = {"students": num_students, "runs": []}
+        for sessions in args.sessions:
+            result["runs"].append(run_load(queries, sessions, llm, speech))
+        result["peak_rss_mb"] = peak_rss_mb()
+        report["results"].append(result)
+        print_report(result)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures what rag_engine costs at import time and on the first parent query.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 3
+
+Each measurement runs in a fresh interpreter so module and model caches do not carry over.
+Needs the local Mongo and ./chroma_db used by the app.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import rag_engine as rag
+import_s = time.perf_counter() - start
+
+warmup_s = 0.0
+if sys.argv[1] == "warm":
+    start = time.perf_counter()
+    rag.warmup()
+    warmup_s = time.perf_counter() - start
+
+query = "What is the fee structure for grade 8?"
+start = time.perf_counter()
+rag.search_general_knowledge(query)
+first_s = time.perf_counter() - start
+
+start = time.perf_counter()
+rag.search_general_knowledge(query)
+second_s = time.perf_counter() - start
+
+print(json.dumps({"import_s": import_s, "warmup_s": warmup_s, "first_query_s": first_s, "second_query_s": second_s}))
+"""
+
+
+def run_probe(mode):
+    out = subprocess.run([sys.executable, "-c", PROBE, mode], cwd=REPO_ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print("----------------------------------------------------------------")
+    print(f"{'mode':<8}{'import ms':>12}{'warmup ms':>12}{'1st query ms':>15}{'2nd query ms':>15}")
+    for mode in ("cold", "warm"):
+        runs = [run_probe(mode) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+        print(f"{mode:<8}{med['import_s']:>12.1f}{med['warmup_s']:>12.1f}{med['first_query_s']:>15.1f}{med['second_query_s']:>15.1f}")
+    print("----------------------------------------------------------------")
+    print("cold: first query pays for model load; warm: warmup() runs at start, before the first query.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compares the old three-query student lookup with the single aggregation pipeline.
+
+Usage:
+    python benchmarks/bench_student_lookup.py --students 50000 --queries 500
+
+Data goes into a separate database (default: school_rag_bench) so the demo data is untouched.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import pymongo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seed_databse as seed  # noqa: E402
+from migrate_db import ensure_indexes  # noqa: E402
+from name_resolver import normalize_name  # noqa: E402
+from rag_engine import student_context_pipeline  # noqa: E402
+
+
+def generate_dataset(db, num_students, batch_size=5000):
+    for name in ("students", "academic_records", "curriculum"):
+        db[name].drop()
+    db.curriculum.insert_many([seed.build_curriculum(g) for g in range(6, 11)])
+
+    student_docs, academic_docs = [], []
+    for counter in range(1, num_students + 1):
+        s_id = f"STU_{counter:07d}"
+        # Numeric suffix keeps most full names unique while first names collide heavily
+        fname = f"{random.choice(seed.names)}{counter}"
+        student_docs.append(seed.build_student(s_id, fname, random.choice(seed.surnames), random.randint(6, 10)))
+        academic_docs.append(seed.build_academic_record(s_id))
+        if len(student_docs) >= batch_size:
+            db.students.insert_many(student_docs, ordered=False)
+            db.academic_records.insert_many(academic_docs, ordered=False)
+            student_docs, academic_docs = [], []
+    if student_docs:
+        db.students.insert_many(student_docs, ordered=False)
+        db.academic_records.insert_many(academic_docs, ordered=False)
+
+
+def legacy_lookup(db, name):
+    """The original path: unanchored regex plus two follow-up queries."""
+    matches = list(db.students.find({"name": {"$regex": name, "$options": "i"}}))
+    if len(matches) != 1:
+        return matches
+    student = matches[0]
+    academics = db.academic_records.find_one({"student_id": student["_id"]})
+    curriculum = db.curriculum.find_one({"grade": student["grade"]})
+    return student, academics, curriculum
+
+
+def pipeline_lookup(db, name):
+    return list(db.students.aggregate(student_context_pipeline(normalize_name(name))))
+
+
+def time_path(fn, db, names):
+    samples = []
+    for name in names:
+        start = time.perf_counter()
+        fn(db, name)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="school_rag_bench")
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--reuse", action="store_true", help="Skip data generation and reuse the existing bench data")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(args.uri)[args.db]
+    if not args.reuse:
+        start = time.perf_counter()
+        generate_dataset(db, args.students)
+        print(f"Generated {args.students} students in {time.perf_counter() - start:.1f}s")
+
+    # Full names, sampled from the data so every query resolves to exactly one student
+    sample = db.students.aggregate([{"$sample": {"size": args.queries}}, {"$project": {"name": 1}}])
+    names = [s["name"] for s in sample]
+
+    print("----------------------------------------------------------------")
+    print(f"{'path':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, fn, indexed in [
+        ("3 queries, no indexes", legacy_lookup, False),
+        ("aggregation, no indexes", pipeline_lookup, False),
+        ("3 queries, indexes", legacy_lookup, True),
+        ("aggregation, indexes", pipeline_lookup, True),
+    ]:
+        if indexed:
+            ensure_indexes(db)
+        else:
+            for name in ("students", "academic_records", "curriculum"):
+                db[name].drop_indexes()
+        stats = time_path(fn, db, names)
+        print(f"{label:<28}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+    print("----------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Local stand-ins for the external services, so the pipeline can be benchmarked offline.
+"""
+import hashlib
+import re
+import time
+
+import numpy as np
+
+
+class HashEmbeddingFunction:
+    """
+    Deterministic bag-of-words embedding: every token is hashed into one of `dim` buckets.
+    Texts sharing words get similar vectors, which is enough for retrieval to behave sensibly.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for token in re.findall(r"\w+", text.lower()):
+                bucket = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little")
+                vector[bucket % self.dim] += 1.0
+            norm = np.linalg.norm(vector)
+            vectors.append((vector / norm if norm else vector).tolist())
+        return vectors
+
+    # Newer chromadb versions ask embedding functions for a name
+    @staticmethod
+    def name():
+        return "hash-embedding"
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _FakeStream:
+    def __init__(self, chunks, usage_metadata, first_token_latency, chunk_latency):
+        self.chunks = chunks
+        self.usage_metadata = usage_metadata
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+
+    def __iter__(self):
+        time.sleep(self.first_token_latency)
+        for idx, chunk in enumerate(self.chunks):
+            if idx:
+                time.sleep(self.chunk_latency)
+            yield chunk
+
+
+class FakeLLM:
+    """
+    Mimics genai.GenerativeModel.generate_content.
+    The answer is a fixed number of words, streamed in chunks of `words_per_chunk` after
+    `first_token_latency` seconds and then `chunk_latency` seconds per chunk.
+    """
+
+    def __init__(self, first_token_latency=0.4, chunk_latency=0.03, answer_words=120, words_per_chunk=8):
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.answer_words = answer_words
+        self.words_per_chunk = words_per_chunk
+
+    def _prompt_text(self, contents):
+        if isinstance(contents, str):
+            return contents
+        return "\n".join(part for message in contents for part in message["parts"])
+
+    def generate_content(self, contents, stream=False):
+        prompt = self._prompt_text(contents)
+        words = [f"word{i % 50}" for i in range(self.answer_words)]
+        for i in range(11, len(words), 12):
+            words[i] += "."
+        chunks = [
+            _Chunk(" ".join(words[i:i + self.words_per_chunk]) + " ")
+            for i in range(0, len(words), self.words_per_chunk)
+        ]
+        usage = _UsageMetadata(len(prompt) // 4, self.answer_words * 4 // 3)
+        if stream:
+            return _FakeStream(chunks, usage, self.first_token_latency, self.chunk_latency)
+
+        time.sleep(self.first_token_latency + self.chunk_latency * (len(chunks) - 1))
+        response = _Chunk("".join(c.text for c in chunks))
+        response.usage_metadata = usage
+        return response
@@ -0,0 +1,238 @@
+"""
+Lexical (BM25) index over the knowledge-base chunks, and the fusion of lexical and vector
+results used by rag_engine.search_knowledge.
+
+Usage:
+    python bm25_index.py build      # rebuild from Mongo (ingest_knowledge.py also does this)
+
+Exact tokens such as "Route_03", "Late Fee" or chapter names are where embeddings are weakest;
+BM25 ranks them directly. The index is a single JSON file (BM25_INDEX_PATH) of chunk ids, texts,
+metadata and postings, replaced atomically on rebuild. Readers keep it in memory and reload it
+when the file changes.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "./bm25_index.json")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant; 60 is the usual choice and keeps one list from dominating
+RRF_K = 60
+
+# Devanagari vowel signs are combining marks, not \w, so the block is listed explicitly
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u097F]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "where", "which", "who", "will", "with",
+    "hai", "ka", "ke", "ki", "kya", "ko", "se", "है", "का", "के", "की", "क्या", "को", "से",
+}
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens without stopwords. Underscore ids also yield their parts, and their
+    numeric parts also without leading zeros, so "Route_03" matches "route_03", "route 3" and
+    "route 03". Other numbers stay as written ("08:00" is "08", "00", never "8").
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        parts = [token]
+        if "_" in token:
+            for part in token.split("_"):
+                parts.append(part)
+                if part.isdigit() and part.lstrip("0") != part:
+                    parts.append(part.lstrip("0") or "0")
+        tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+def matches_where(metadata, where):
+    """Chroma-style metadata filter on one chunk (the subset flat_index supports)."""
+    for field, condition in where.items():
+        if field == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            (op, expected), = condition.items()
+            ok = {"$eq": lambda: value == expected, "$ne": lambda: value != expected,
+                  "$in": lambda: value in expected, "$nin": lambda: value not in expected}.get(op)
+            if ok is None:
+                raise ValueError(f"Unsupported filter operator {op}")
+            if not ok():
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+# ==========================================
+# 1. BUILDING
+# ==========================================
+def build_bm25(chunks):
+    """Index data for an iterable of ingest_knowledge chunks ({id, text, metadata}); duplicates are skipped."""
+    ids, texts, metadatas, lengths, postings, seen = [], [], [], [], {}, set()
+    for chunk in chunks:
+        if chunk["id"] in seen:
+            continue
+        seen.add(chunk["id"])
+        position = len(ids)
+        ids.append(chunk["id"])
+        texts.append(chunk["text"])
+        metadatas.append(chunk["metadata"])
+        counts = Counter(tokenize(chunk["text"]))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append([position, tf])
+    return {"ids": ids, "texts": texts, "metadatas": metadatas, "lengths": lengths, "postings": postings}
+
+
+def write_bm25(data, path=BM25_INDEX_PATH):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+# ==========================================
+# 2. QUERYING
+# ==========================================
+class BM25Index:
+    """
+    Okapi BM25 over the chunk texts. Built from `data` (build_bm25) or loaded from `path`.
+    A missing file is an empty index until ingestion writes one, so lexical search degrades to
+    no results instead of failing the request.
+    """
+
+    def __init__(self, path=BM25_INDEX_PATH, data=None, reload_check_interval=30):
+        self.path = path
+        self.reload_check_interval = reload_check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        if data is not None:
+            self.path = None
+            self._index(data)
+        else:
+            self._load()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            mtime, data = None, build_bm25([])
+        self._index(data)
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+
+    def _index(self, data):
+        count = len(data["ids"])
+        average_length = sum(data["lengths"]) / count if count else 0.0
+        idf = {term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+               for term, docs in data["postings"].items()}
+        self.data, self.idf, self.average_length = data, idf, average_length
+
+    def refresh(self):
+        """Reloads the file if it changed since the last check."""
+        if self.path is None or time.monotonic() - self._checked_at < self.reload_check_interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._load()
+
+    def count(self):
+        return len(self.data["ids"])
+
+    def search(self, query, n_results=10, where=None):
+        """Ranked chunks as dicts with id, text, metadata and score (BM25)."""
+        self.refresh()
+        data, idf, average_length = self.data, self.idf, self.average_length
+        scores = {}
+        for term in set(tokenize(query)):
+            for position, tf in data["postings"].get(term, ()):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * data["lengths"][position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        results = []
+        for position, score in ranked:
+            metadata = data["metadatas"][position] or {}
+            if where and not matches_where(metadata, where):
+                continue
+            results.append({"id": data["ids"][position], "text": data["texts"][position], "metadata": metadata,
+                            "score": score})
+            if len(results) >= n_results:
+                break
+        return results
+
+
+# ==========================================
+# 3. FUSION
+# ==========================================
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """
+    Merges ranked chunk lists by sum of 1 / (k + rank). Returns chunks best-first with
+    "rrf_score" and "sources" (names of the lists that returned them) added.
+    """
+    fused = {}
+    for source, chunks in ranked_lists.items():
+        for rank, chunk in enumerate(chunks, start=1):
+            entry = fused.setdefault(chunk["id"], {**chunk, "rrf_score": 0.0, "sources": []})
+            entry["rrf_score"] += 1.0 / (k + rank)
+            entry["sources"].append(source)
+            if entry.get("distance") is None and chunk.get("distance") is not None:
+                entry["distance"] = chunk["distance"]
+    return sorted(fused.values(), key=lambda chunk: -chunk["rrf_score"])
+
+
+def select_distinct(chunks, n_results):
+    """
+    The first `n_results` fused chunks (best-first), skipping any whose text repeats an earlier
+    one once case and whitespace are normalized (e.g. the same policy stored under two ids).
+    Text similarity is deliberately not used: timetables, syllabi and routes share templates,
+    and chunks that differ only in grade, day or route are different facts.
+    """
+    selected, seen = [], set()
+    for chunk in chunks:
+        key = " ".join(chunk["text"].lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+        selected.append(chunk)
+        if len(selected) >= n_results:
+            break
+    return selected
+
+if __name__ == "__main__":
+    import rag_engine as rag
+    from ingest_knowledge import iter_knowledge_chunks
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Rebuild the index from Mongo")
+    build.add_argument("--path", default=BM25_INDEX_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = build_bm25(iter_knowledge_chunks(rag.get_mongo_db()))
+    write_bm25(data, args.path)
+    print(f"Indexed {len(data['ids'])} chunks ({len(data['postings'])} terms) into {args.path} "
+          f"in {time.perf_counter() - start:.1f}s")
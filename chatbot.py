@@ -1,5 +1,9 @@
 import google.generativeai as genai
 import rag_engine as rag  
+from conversation import Conversation
+from context_builder import build_context
+from prompts import SYSTEM_INSTRUCTIONS
+import metrics
 import os
 from dotenv import load_dotenv
 
@@ -14,43 +18,16 @@ else:
 
 genai.configure(api_key=API_KEY)
 
-
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-
-chat = model.start_chat(history=[])
-
-SYSTEM_INSTRUCTIONS = """
-You are "EduBot," a warm, empathetic, and professional school counselor assistant. 
-Your goal is to help parents track their child's progress and understand school policies.
-
-CORE BEHAVIORS:
-1. **Be Warm & Encouraging:** Never just state a bad grade. If a student scored low, add a constructive remark like "This area needs a little more focus" or "He is showing potential to improve."
-2. **Context First:** Answer strictly using the provided Context. If the answer isn't there, say, "I'm sorry, I don't have that specific record right now. Please check with the administration."
-3. **Privacy:** Only discuss the student named in the query.
-4. **Language:** Adapt to the language of the user. If they ask in Hindi, reply in Hindi. If they ask in Hinglish, reply in Hinglish.
-
-TONE EXAMPLES:
-- Bad Grade: "Aarav scored 45/100 in Math. While this is below the passing mark, his teacher noted he is polite. A bit of extra practice in Algebra could really help him bounce back!"
-- Good Grade: "Great news! Vivaan scored 92/100. He is really excelling in this subject."
-"""
-
-def extract_potential_student_names(query):
-    """
-    Simple helper to check if any known student name exists in the query.
-    In a real app, we would query the DB for a list of all names first.
-    For this demo, we check if the query contains names we know exist in our dummy DB.
-    """
-    # This is a simplified check. In production, fetch this list dynamically from MongoDB.
-    known_students = ["Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", 
-                      "Ayaan", "Krishna", "Ishaan", "Diya", "Saanvi", "Ananya", "Aadhya", 
-                      "Pari", "Kiara", "Myra", "Riya", "Anvi", "Fatima"]
-    
-    found_names = [name for name in known_students if name.lower() in query.lower()]
-    return found_names[0] if found_names else None
+# System instructions are attached to the model once, not repeated in every turn
+model = genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_INSTRUCTIONS)
 
 
 def run_chat():
+    print("(System: Loading knowledge base and embedding model...)")
+    rag.warmup()
+    metrics.start_exporters()
+    conversation = Conversation(model)
+
     print("-----------------------------------------------------------")
     print("🎓 PARENT-TEACHER ASSISTANT IS LIVE")
     print("Ask about: Grades, Fees, Syllabus, Bus Routes, or specific students.")
@@ -58,47 +35,77 @@ def run_chat():
     print("-----------------------------------------------------------")
 
     while True:
+        trace = None
         try:
             user_input = input("\nParent: ")
             if user_input.lower() in ["exit", "quit"]:
                 print("Assistant: Goodbye! Have a great day.")
                 break
 
-            
-            context_pieces = []
-            
-            
-            general_info = rag.search_general_knowledge(user_input)
-            if general_info:
-                context_pieces.append(f"📚 SCHOOL KNOWLEDGE BASE:\n{general_info}")
-
-            
-            student_name = extract_potential_student_names(user_input)
+            trace = metrics.start_trace("cli")
+            trace.attach(query=user_input)
+            student_name = rag.extract_student_name(user_input)
+            trace.attach(student=student_name)
+            query_embedding = None
             if student_name:
                 print(f"(System: Fetching detailed records for {student_name}...)")
-                student_record = rag.get_student_info(student_name)
-                if student_record:
-                    context_pieces.append(f"👤 STUDENT RECORD:\n{student_record}")
-
-            # Combine Context
-            full_context = "\n\n".join(context_pieces)
-
-            prompt = f"""
-            {SYSTEM_INSTRUCTIONS}
-
-            CONTEXT FOR THIS QUERY:
-            {full_context}
-
-            USER QUERY:
-            {user_input}
-            """
-
-            # Send to Gemini
-            response = chat.send_message(prompt)
-            
-            print(f"Assistant: {response.text}")
+            else:
+                # Exact lookups (timetables, routes, exam dates, late fee) are answered without the LLM
+                fast_answer = rag.answer_fast_path(user_input)
+                if fast_answer is not None:
+                    print(f"Assistant: {fast_answer['answer']}")
+                    print(f"(System: answered by fast path '{fast_answer['rule']}')")
+                    conversation.record(user_input, fast_answer["answer"])
+                    trace.set(student_query=False, cache_hit=False, fast_path=fast_answer["rule"])
+                    trace.attach(answer=fast_answer["answer"])
+                    trace.finish()
+                    continue
+
+                # General questions may already have a cached answer
+                with metrics.timed("answer_cache_lookup"):
+                    cached_answer, query_embedding = rag.get_answer_cache().lookup(user_input)
+                if cached_answer is not None:
+                    print(f"Assistant: {cached_answer}")
+                    print("(System: answered from cache)")
+                    conversation.record(user_input, cached_answer)
+                    trace.set(student_query=False, cache_hit=True)
+                    trace.attach(answer=cached_answer)
+                    trace.finish()
+                    continue
+            trace.set(student_query=bool(student_name), cache_hit=False)
+
+            # Knowledge search and student lookup run concurrently
+            retrieved = rag.retrieve_context(user_input, student_name, query_embedding=query_embedding)
+
+            for source, reason in retrieved["unavailable"].items():
+                print(f"(System: {source} unavailable: {reason})")
+
+            # Only the sections relevant to the question, within the token budget
+            with metrics.timed("prompt_assembly"):
+                full_context, context_details = build_context(user_input, retrieved)
+            trace.set(intents=context_details["intents"], context_tokens=context_details["tokens"],
+                      chunk_ids=context_details["chunk_ids"], unavailable=list(retrieved["unavailable"]))
+            print(f"(System: context {context_details['tokens']} tokens, intents: {', '.join(context_details['intents']) or 'general'})")
+
+            # Send to Gemini and print chunks as they arrive
+            reply = conversation.stream_reply(user_input, full_context, student_name)
+            print("Assistant: ", end="", flush=True)
+            for chunk in reply:
+                print(chunk, end="", flush=True)
+            print()
+            print(f"(System: first token in {reply.time_to_first_token or 0:.2f}s, total {reply.total_time:.2f}s)")
+            metrics.record_llm(reply, full_context)
+
+            # Only answers grounded purely in the knowledge base (no student anywhere in the history) are reusable
+            if (not student_name and not conversation.has_student_context
+                    and retrieved["knowledge_chunks"] and not retrieved["unavailable"]):
+                rag.get_answer_cache().store(user_input, reply.text, query_embedding)
+            trace.attach(answer=reply.text)
+            trace.finish()
 
         except Exception as e:
+            if trace:
+                trace.finish(status="error", error=e)
             print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
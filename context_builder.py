@@ -0,0 +1,188 @@
+import math
+import os
+import re
+
+# ==========================================
+# 1. INTENT CLASSIFICATION
+# ==========================================
+# Keywords cover English, Hinglish and Devanagari Hindi, since parents write in all three.
+INTENT_KEYWORDS = {
+    "grades": ["grade card", "report card", "marks", "mark", "score", "scored", "result", "results", "exam",
+               "test", "performance", "pass", "fail", "progress", "ank", "number", "अंक", "नंबर", "परिणाम"],
+    "attendance": ["attendance", "absent", "present", "leave", "hajri", "haziri", "upasthiti", "हाजिरी", "उपस्थिति"],
+    "timetable": ["timetable", "time table", "schedule", "period", "periods", "class today", "tomorrow",
+                  "monday", "tuesday", "wednesday", "thursday", "friday", "samay sarni", "समय सारणी"],
+    "syllabus": ["syllabus", "chapter", "chapters", "topic", "topics", "portion", "curriculum", "pathyakram", "पाठ्यक्रम"],
+    "homework": ["homework", "assignment", "assignments", "project", "pending", "due", "grihkarya", "गृहकार्य"],
+    "transport": ["bus", "route", "driver", "pickup", "pick up", "drop", "transport", "van", "stop", "बस"],
+    "fees": ["fee", "fees", "tuition", "payment", "late fee", "dues", "charges", "shulk", "फीस", "शुल्क"],
+}
+
+# Which knowledge-base categories (ingest_knowledge metadata) each intent prefers
+INTENT_CATEGORIES = {
+    "grades": {"policies", "exams"},
+    "attendance": {"policies"},
+    "timetable": {"timetable"},
+    "syllabus": {"syllabus", "exams"},
+    "homework": set(),
+    "transport": {"transport"},
+    "fees": {"policies"},
+}
+
+# Student sections included when the query has no recognizable intent
+DEFAULT_STUDENT_SECTIONS = ["grades", "attendance", "homework"]
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+
+_PATTERNS = {
+    intent: re.compile(r"(?<!\w)(" + "|".join(re.escape(k) for k in keywords) + r")(?!\w)", re.IGNORECASE)
+    for intent, keywords in INTENT_KEYWORDS.items()
+}
+
+
+def classify_intents(query):
+    """Returns the set of intents mentioned in the query (may be empty)."""
+    return {intent for intent, pattern in _PATTERNS.items() if pattern.search(query)}
+
+
+# ==========================================
+# 2. COMPACT SERIALIZATION
+# ==========================================
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return math.ceil(len(text) / 4)
+
+
+def _profile_section(record):
+    return f"{record['name']} | Grade {record['grade']}-{record['section']} | Emergency contact: {record.get('emergency_contact')}"
+
+
+def _grades_section(record):
+    lines = ["Report card (UT1 /25, Half-yearly /100, Project /20):"]
+    for row in record.get("grade_card") or []:
+        # Digest records (student_digest.py) carry the derived percentage and pass/fail
+        derived = f" = {row['percentage']}% {'PASS' if row['passed'] else 'FAIL'}" if "percentage" in row else ""
+        lines.append(f"- {row['subject']}: {row['unit_test_1']}, {row['half_yearly']}, {row['project_score']}{derived} ({row['remarks']})")
+    if record.get("aggregate_percentage") is not None:
+        verdict = "meets" if record.get("passed") else "does not meet"
+        lines.append(f"Aggregate: {record['aggregate_percentage']}% ({verdict} the promotion rule: 35% per subject, 40% aggregate)")
+    return "\n".join(lines)
+
+
+def _attendance_section(record):
+    attendance = record.get("attendance") or {}
+    if "meets_requirement" not in attendance:
+        return f"Attendance: {record.get('attendance_percentage')}%"
+    status = "meets" if attendance["meets_requirement"] else f"below, short by {attendance['days_short']} days"
+    return f"Attendance: {attendance['percentage']}% ({status} the {attendance['required_percentage']}% requirement)"
+
+
+def _homework_section(record):
+    pending = record.get("pending_assignments") or []
+    if not pending:
+        return "Pending homework: none"
+    overdue = {(a["subject"], a["title"]) for a in record.get("overdue_assignments") or []}
+    items = "; ".join(
+        f"{a['subject']} - {a['title']} (due {a['due_date']}{', OVERDUE' if (a['subject'], a['title']) in overdue else ''})"
+        for a in pending
+    )
+    return f"Pending homework: {items}"
+
+
+def _transport_section(record):
+    logistics = record.get("logistics") or {}
+    return f"Transport: {logistics.get('mode')}, {logistics.get('route_id')}, stop {logistics.get('stop_name')}"
+
+
+def _timetable_section(record, query):
+    timetable = record.get("timetable") or {}
+    asked = [d for d in DAYS if d in query.lower()]
+    lines = []
+    for day in asked or list(timetable):
+        periods = timetable.get(day.capitalize()) or timetable.get(day) or []
+        lines.append(f"{day.capitalize()}: " + ", ".join(f"{p['time']} {p['subject']}" for p in periods))
+    return "Timetable:\n" + "\n".join(lines)
+
+
+def _syllabus_section(record, query):
+    syllabus = record.get("syllabus") or {}
+    asked = [s for s in syllabus if s.lower() in query.lower()]
+    lines = [f"{subject}: {'; '.join(syllabus[subject])}" for subject in (asked or list(syllabus))]
+    return "Syllabus:\n" + "\n".join(lines)
+
+
+SECTION_BUILDERS = {
+    "grades": lambda record, query: _grades_section(record),
+    "attendance": lambda record, query: _attendance_section(record),
+    "homework": lambda record, query: _homework_section(record),
+    "transport": lambda record, query: _transport_section(record),
+    "timetable": _timetable_section,
+    "syllabus": _syllabus_section,
+}
+
+
+# ==========================================
+# 3. BUDGETED ASSEMBLY
+# ==========================================
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+
+def build_context(query, retrieved, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Turns the output of rag_engine.retrieve_context into the prompt context.
+    - Student sections are picked by intent; knowledge chunks are ranked by retrieval order,
+      boosted when their category matches an intent.
+    - Pieces are added best-first until `token_budget` is reached; lower-ranked pieces are dropped.
+    Returns (context_text, details) where details records intents, tokens and the chunk ids used.
+    """
+    intents = classify_intents(query)
+    candidates = []  # (score, order, kind, text, chunk_id)
+
+    # Alerts are always kept
+    alerts = []
+    record = retrieved.get("student_record")
+    if isinstance(record, str):
+        alerts.append(f"⚠️ SYSTEM ALERT: {record}")
+    if "student_record" in retrieved.get("unavailable", {}):
+        alerts.append("⚠️ SYSTEM ALERT: Student records are temporarily unavailable. Tell the parent to try again shortly.")
+
+    if isinstance(record, dict):
+        candidates.append((100.0, 0, "student", _profile_section(record), None))
+        sections = [s for s in SECTION_BUILDERS if s in intents] or DEFAULT_STUDENT_SECTIONS
+        for order, section in enumerate(sections, start=1):
+            score = 50.0 if section in intents else 10.0
+            candidates.append((score, order, "student", SECTION_BUILDERS[section](record, query), None))
+
+    preferred = set().union(*(INTENT_CATEGORIES[i] for i in intents)) if intents else set()
+    for rank, chunk in enumerate(retrieved.get("knowledge_chunks") or []):
+        score = 20.0 / (1 + rank)
+        if chunk["metadata"].get("category") in preferred:
+            score += 20.0
+        candidates.append((score, rank, "knowledge", chunk["text"], chunk["id"]))
+
+    used_tokens = sum(estimate_tokens(a) for a in alerts)
+    selected = []
+    for candidate in sorted(candidates, key=lambda c: -c[0]):
+        cost = estimate_tokens(candidate[3])
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(candidate)
+        used_tokens += cost
+
+    # Present in natural order: profile first, then sections, then chunks by retrieval rank
+    student_lines = [c[3] for c in sorted((c for c in selected if c[2] == "student"), key=lambda c: c[1])]
+    knowledge = sorted((c for c in selected if c[2] == "knowledge"), key=lambda c: c[1])
+
+    pieces = list(alerts)
+    if student_lines:
+        pieces.append("👤 STUDENT RECORD:\n" + "\n".join(student_lines))
+    if knowledge:
+        pieces.append("📚 SCHOOL KNOWLEDGE BASE:\n" + "\n---\n".join(c[3] for c in knowledge))
+
+    details = {
+        "intents": sorted(intents),
+        "tokens": used_tokens,
+        "chunk_ids": [c[4] for c in knowledge],
+        "dropped": len(candidates) - len(selected),
+    }
+    return "\n\n".join(pieces), details
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from context_builder import estimate_tokens
+from llm_stream import StreamedReply
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+KEEP_RECENT_TURNS = int(os.getenv("HISTORY_KEEP_RECENT_TURNS", "3"))
+# After a failed summarization, compact locally (no LLM call) for this long, doubling per failure
+SUMMARY_RETRY_SECONDS = float(os.getenv("HISTORY_SUMMARY_RETRY_SECONDS", "30"))
+SUMMARY_RETRY_MAX_SECONDS = float(os.getenv("HISTORY_SUMMARY_RETRY_MAX_SECONDS", "600"))
+
+SUMMARY_PROMPT = """Summarize this conversation between a parent and the school assistant in at most 5 short bullet points.
+Keep student names, grades, dates and any open questions. Reply in English.
+
+{existing_summary}{transcript}"""
+
+
+def format_user_turn(question, context):
+    return f"""CONTEXT FOUND IN DATABASE:
+{context}
+
+USER QUERY:
+{question}"""
+
+
+class Conversation:
+    """
+    Bounded chat history for Gemini.
+    - System instructions live on the model (system_instruction=...), so they are sent once per
+      request instead of being repeated inside every stored turn.
+    - Only the question and the answer are stored per turn; the retrieved context is sent with
+      the current question and then dropped.
+    - When stored turns exceed `token_budget`, everything but the last `keep_recent_turns`
+      is folded into a running summary. That runs on a background thread after the turn is
+      recorded, so the reply, the TTS and the API's session lock never wait on the summary call.
+      After a failed summarization, compaction keeps the transcript tail without calling the
+      LLM until a backoff expires.
+    - `has_student_context` turns True once any turn was about a student and never resets
+      (the summary keeps it). Later answers may draw on that record, so they must not go
+      into the shared answer cache.
+    """
+
+    def __init__(self, model, token_budget=HISTORY_TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS):
+        self.model = model
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary = ""
+        self.turns = []  # [{"user": question, "model": answer}]
+        self.has_student_context = False
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._summary_failures = 0
+        self._summary_retry_at = 0.0
+
+    def history_tokens(self):
+        tokens = estimate_tokens(self.summary)
+        for turn in self.turns:
+            tokens += estimate_tokens(turn["user"]) + estimate_tokens(turn["model"])
+        return tokens
+
+    def build_contents(self, question, context):
+        with self._lock:
+            summary, turns = self.summary, list(self.turns)
+        contents = []
+        if summary:
+            contents.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{summary}"]})
+            contents.append({"role": "model", "parts": ["Understood, I will keep that in mind."]})
+        for turn in turns:
+            contents.append({"role": "user", "parts": [turn["user"]]})
+            contents.append({"role": "model", "parts": [turn["model"]]})
+        contents.append({"role": "user", "parts": [format_user_turn(question, context)]})
+        return contents
+
+    def stream_reply(self, question, context, student=None):
+        """Streams the answer; the turn is recorded (and history compacted) once the stream completes."""
+        contents = self.build_contents(question, context)
+        if student:
+            self.has_student_context = True
+        return StreamedReply(
+            lambda: self.model.generate_content(contents, stream=True),
+            on_complete=lambda answer: self.record(question, answer, student),
+        )
+
+    def record(self, question, answer, student=None):
+        if student:
+            self.has_student_context = True
+        with self._lock:
+            self.turns.append({"user": question, "model": answer})
+            if self._compacting or self.history_tokens() <= self.token_budget:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name="history-compaction", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        with self._lock:
+            if len(self.turns) <= self.keep_recent_turns:
+                return
+            split = len(self.turns) - self.keep_recent_turns
+            old_turns, existing_summary = self.turns[:split], self.summary
+
+        transcript = "\n".join(f"Parent: {t['user']}\nAssistant: {t['model']}" for t in old_turns)
+        existing = f"Earlier summary:\n{existing_summary}\n\n" if existing_summary else ""
+        summary = None
+        if time.monotonic() >= self._summary_retry_at:
+            try:
+                response = self.model.generate_content(SUMMARY_PROMPT.format(existing_summary=existing, transcript=transcript))
+                summary = response.text.strip()
+                self._summary_failures = 0
+            except Exception:
+                self._summary_failures += 1
+                backoff = SUMMARY_RETRY_SECONDS * 2 ** (self._summary_failures - 1)
+                self._summary_retry_at = time.monotonic() + min(backoff, SUMMARY_RETRY_MAX_SECONDS)
+        if summary is None:
+            # Never lose context silently: keep the tail of the transcript (~half the budget)
+            summary = (existing + transcript)[-2 * self.token_budget:]
+
+        with self._lock:
+            # Turns are only ever appended meanwhile, so the first `split` are still the old ones
+            del self.turns[:split]
+            self.summary = summary
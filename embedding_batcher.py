@@ -0,0 +1,64 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-query embeddings into one batched encode.
+    - Requests queue up; a worker thread takes whatever is waiting, holds the batch open for at
+      most `max_wait_ms` (or until `max_batch_size`), then runs one forward pass for all of them.
+    - Callable like a Chroma embedding function, so it can stand in for one.
+    """
+
+    def __init__(self, embed_fn, max_batch_size=32, max_wait_ms=5):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text, timeout=None):
+        return self.submit(text).result(timeout=timeout)
+
+    def __call__(self, input):
+        futures = [self.submit(text) for text in input]
+        return [future.result() for future in futures]
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Take what is already queued without waiting; only then wait out the window
+                batch.append(self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embed_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            REGISTRY.observe("edubot_embedding_batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS,
+                             help_text="Queries embedded per batched forward pass")
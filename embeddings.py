@@ -0,0 +1,145 @@
+"""
+Embedding backends for all-MiniLM-L6-v2. Queries and ingestion use the same one (EMBED_BACKEND):
+
+    sentence-transformers   PyTorch via chromadb's SentenceTransformerEmbeddingFunction (default)
+    onnx                    ONNX Runtime on CPU, fp32 export of the same weights
+    onnx-int8               ONNX Runtime with dynamic int8 quantization (smallest, fastest on CPU)
+
+The ONNX backends only need onnxruntime, tokenizers and numpy at runtime. Export the model once
+(this step needs torch + transformers, and reads the local Hugging Face cache when --offline):
+
+    python embeddings.py export                  # writes model.onnx, model.int8.onnx, tokenizer.json
+    python embeddings.py export --offline --no-quantize
+
+Check parity and speed with benchmarks/bench_embeddings.py before switching a deployment.
+"""
+import argparse
+import os
+
+import numpy as np
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "sentence-transformers")
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", f"./models/{EMBED_MODEL_NAME}-onnx")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # 0 lets ONNX Runtime pick
+
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+# all-MiniLM-L6-v2 was trained with 256-token inputs; longer text is truncated the same way
+MAX_SEQ_LENGTH = 256
+
+
+# ==========================================
+# 1. BACKENDS
+# ==========================================
+class OnnxMiniLMEmbedding:
+    """
+    Same output as the sentence-transformers model: token embeddings from the exported
+    transformer, mean-pooled over the attention mask, then L2-normalized.
+    """
+
+    def __init__(self, model_dir=EMBED_ONNX_DIR, quantized=False, threads=EMBED_THREADS, max_length=MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.backend = "onnx-int8" if quantized else "onnx"
+        model_path = os.path.join(model_dir, ONNX_FILES[self.backend])
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found. Run 'python embeddings.py export' first.")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    # Newer chromadb versions ask embedding functions for a name
+    def name(self):
+        return f"{EMBED_MODEL_NAME}-{self.backend}"
+
+    def __call__(self, input):
+        encodings = self.tokenizer.encode_batch(list(input))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask,
+                 "token_type_ids": np.zeros_like(input_ids)}
+        token_embeddings = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+def embedder_id(embed_fn):
+    """
+    Identifies the vector space an embedding function produces. ingest_knowledge stores it with
+    every chunk, so chunks embedded by another backend are re-embedded after a switch.
+    """
+    name = getattr(embed_fn, "name", None)
+    name = name() if callable(name) else type(embed_fn).__name__
+    model = getattr(embed_fn, "model_name", None)
+    return f"{name}:{model}" if model and model not in name else name
+
+
+def make_embed_fn(backend=EMBED_BACKEND, model_dir=EMBED_ONNX_DIR):
+    if backend == "sentence-transformers":
+        from chromadb.utils import embedding_functions
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_NAME)
+    if backend in ONNX_FILES:
+        return OnnxMiniLMEmbedding(model_dir, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of: sentence-transformers, {', '.join(ONNX_FILES)}")
+
+
+# ==========================================
+# 2. ONE-TIME EXPORT
+# ==========================================
+def export_onnx(out_dir=EMBED_ONNX_DIR, quantize=True, offline=False, opset=14):
+    """Exports the transformer to ONNX (and an int8 copy) next to its tokenizer.json."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = f"sentence-transformers/{EMBED_MODEL_NAME}"
+    tokenizer = AutoTokenizer.from_pretrained(hub_name, local_files_only=offline)
+    model = AutoModel.from_pretrained(hub_name, local_files_only=offline).eval()
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)  # fast tokenizers write tokenizer.json
+
+    sample = tokenizer(["When does the school bus leave?"], return_tensors="pt")
+    model_path = os.path.join(out_dir, ONNX_FILES["onnx"])
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                          "last_hidden_state": dynamic},
+            opset_version=opset,
+        )
+    written = [model_path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(out_dir, ONNX_FILES["onnx-int8"])
+        quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+        written.append(int8_path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export all-MiniLM-L6-v2 to ONNX")
+    export.add_argument("--out", default=EMBED_ONNX_DIR)
+    export.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    export.add_argument("--offline", action="store_true", help="Only use the local Hugging Face cache")
+    args = parser.parse_args()
+
+    for path in export_onnx(args.out, quantize=not args.no_quantize, offline=args.offline):
+        print(f"Wrote {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,231 @@
+"""
+Rule-based fast path for factual lookups that the structured Mongo data answers exactly:
+grade timetables, bus routes, exam dates and the late fee.
+
+route(query) returns {"answer", "rule", "confidence", "lang"} when a rule matches with enough
+confidence, otherwise None and the caller continues with the RAG/LLM path. Every rule is one
+indexed find_one (curriculum.grade, school_info.category, school_info.routes.route_id).
+"""
+import os
+import re
+
+from context_builder import DAYS
+
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+# Long or open-ended questions want an explanation, not a lookup
+MAX_QUERY_WORDS = 20
+OPEN_ENDED = re.compile(
+    r"(?<!\w)(why|explain|should|compare|difference|improve|suggest|worried|kyun|kyon|kaise|क्यों|कैसे)(?!\w)",
+    re.IGNORECASE,
+)
+
+
+# ==========================================
+# 1. RESPONSE TEMPLATES
+# ==========================================
+TEMPLATES = {
+    "timetable": {
+        "en": "Grade {grade} timetable for {day}:\n{periods}",
+        "hi": "कक्षा {grade} की {day} की समय सारणी:\n{periods}",
+    },
+    "route": {
+        "en": "{route_id} is driven by {driver_name} (contact: {driver_contact}). Pickup starts at {pickup_start}, "
+              "the bus reaches school at {school_reach} and leaves for the drop at {drop_start}.",
+        "hi": "{route_id} के ड्राइवर {driver_name} हैं (संपर्क: {driver_contact})। पिकअप {pickup_start} से शुरू होता है, "
+              "बस {school_reach} तक स्कूल पहुँचती है और छुट्टी के बाद {drop_start} पर निकलती है।",
+    },
+    "subject_exam": {
+        "en": "The Grade {grade} {exam} {subject} exam is on {date}.",
+        "hi": "कक्षा {grade} की {exam} {subject} परीक्षा {date} को है।",
+    },
+    "exam_window": {
+        "en": "{event} run from {start_date} to {end_date}.",
+        "hi": "{event} {start_date} से {end_date} तक होंगी।",
+    },
+    "late_fee": {
+        "en": "The late fee is {late_fee}.",
+        "hi": "विलंब शुल्क (Late Fee): {late_fee}।",
+    },
+}
+
+DAY_NAMES = {
+    "monday": ("Monday", "सोमवार"), "tuesday": ("Tuesday", "मंगलवार"), "wednesday": ("Wednesday", "बुधवार"),
+    "thursday": ("Thursday", "गुरुवार"), "friday": ("Friday", "शुक्रवार"),
+}
+# Hinglish and Devanagari spellings of the school days
+DAY_ALIASES = {
+    "somvar": "monday", "सोमवार": "monday", "mangalvar": "tuesday", "मंगलवार": "tuesday",
+    "budhvar": "wednesday", "बुधवार": "wednesday", "guruvar": "thursday", "गुरुवार": "thursday",
+    "shukravar": "friday", "शुक्रवार": "friday",
+    **{day: day for day in DAYS},
+}
+
+_DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+
+
+def detect_language(query):
+    """'hi' for Devanagari queries, otherwise 'en' (Hinglish is answered in English)."""
+    return "hi" if _DEVANAGARI.search(query) else "en"
+
+
+def render(template, lang, **fields):
+    templates = TEMPLATES[template]
+    return templates.get(lang, templates["en"]).format(**fields)
+
+
+# ==========================================
+# 2. SLOT EXTRACTION
+# ==========================================
+_GRADE = re.compile(r"(?:grade|class|std|kaksha|कक्षा)\s*(\d{1,2})|(\d{1,2})\s*(?:st|nd|rd|th)?\s*(?:grade|class|std)",
+                    re.IGNORECASE)
+_ROUTE = re.compile(r"route[\s_-]*(?:no\.?\s*)?0*(\d{1,2})(?!\d)", re.IGNORECASE)
+_DAY = re.compile(r"(?<!\w)(" + "|".join(DAY_ALIASES) + r")(?!\w)", re.IGNORECASE)
+
+_TIMETABLE_WORDS = re.compile(r"(?<!\w)(timetable|time table|schedule|periods?|classes|samay sarni|समय सारणी)(?!\w)",
+                              re.IGNORECASE)
+_ROUTE_WORDS = re.compile(r"(?<!\w)(driver|contact|number|phone|timings?|time|pickup|pick up|drop|leave|leaves|"
+                          r"reach|when|kab|ड्राइवर|समय|कब)(?!\w)", re.IGNORECASE)
+_EXAM_WORDS = re.compile(r"(?<!\w)(exams?|examinations?|pariksha|परीक्षा|परीक्षाएं)(?!\w)", re.IGNORECASE)
+_DATE_WORDS = re.compile(r"(?<!\w)(when|date|dates|start|starts|begin|begins|schedule|kab|tarikh|कब|तारीख)(?!\w)",
+                         re.IGNORECASE)
+_LATE_FEE = re.compile(r"(?<!\w)(late fee|late fees|fine for late|vilamb shulk|विलंब शुल्क)(?!\w)", re.IGNORECASE)
+
+# Exam names as they appear in the calendar / datesheet, with their spoken variants
+EXAM_NAMES = {
+    "Half-Yearly": re.compile(r"half[\s-]*yearly|mid[\s-]*term|ardhvarshik|अर्धवार्षिक", re.IGNORECASE),
+    "Final": re.compile(r"final|annual|varshik|वार्षिक", re.IGNORECASE),
+}
+
+
+def _grade(query):
+    match = _GRADE.search(query)
+    return int(match.group(1) or match.group(2)) if match else None
+
+
+def _day(query):
+    match = _DAY.search(query)
+    return DAY_ALIASES[match.group(1).lower()] if match else None
+
+
+def _exam_name(query):
+    # "Half-Yearly" is checked first so "half yearly final revision" is not read as the final exam
+    for exam, pattern in EXAM_NAMES.items():
+        if pattern.search(query):
+            return exam
+    return None
+
+
+# ==========================================
+# 3. ROUTER
+# ==========================================
+class FastPathRouter:
+    """
+    Tries each rule in order; a rule returns (confidence, template, fields) or None.
+    Confidence starts at 1.0 when every slot was found explicitly and is lowered for
+    open-ended or long questions, which are better served by the LLM.
+    """
+
+    def __init__(self, db, min_confidence=FAST_PATH_MIN_CONFIDENCE):
+        self.db = db
+        self.min_confidence = min_confidence
+        self.rules = [
+            ("timetable", self._timetable),
+            ("route", self._route),
+            ("subject_exam", self._subject_exam),
+            ("exam_window", self._exam_window),
+            ("late_fee", self._late_fee),
+        ]
+
+    def route(self, query):
+        penalty = 0.0
+        if OPEN_ENDED.search(query):
+            penalty += 0.5
+        if len(query.split()) > MAX_QUERY_WORDS:
+            penalty += 0.3
+
+        lang = detect_language(query)
+        for name, rule in self.rules:
+            result = rule(query, lang)
+            if result is None:
+                continue
+            confidence, template, fields = result
+            confidence -= penalty
+            if confidence < self.min_confidence:
+                return None
+            return {"answer": render(template, lang, **fields), "rule": name, "confidence": confidence, "lang": lang}
+        return None
+
+    # --- Rules ---
+    def _timetable(self, query, lang):
+        grade, day = _grade(query), _day(query)
+        if grade is None or day is None or not _TIMETABLE_WORDS.search(query):
+            return None
+        english_day, hindi_day = DAY_NAMES[day]
+        doc = self.db.curriculum.find_one({"grade": grade}, {f"timetable.{english_day}": 1})
+        periods = (doc or {}).get("timetable", {}).get(english_day)
+        if not periods:
+            return None
+        lines = "\n".join(f"- {p['time']}: {p['subject']}" for p in periods)
+        return 1.0, "timetable", {"grade": grade, "day": hindi_day if lang == "hi" else english_day, "periods": lines}
+
+    def _route(self, query, lang):
+        match = _ROUTE.search(query)
+        if not match or not _ROUTE_WORDS.search(query):
+            return None
+        route_id = f"Route_{int(match.group(1)):02d}"
+        doc = self.db.school_info.find_one(
+            {"category": "transport", "routes.route_id": route_id},
+            {"routes": {"$elemMatch": {"route_id": route_id}}},
+        )
+        if not doc or not doc.get("routes"):
+            return None
+        route = doc["routes"][0]
+        timings = route.get("timings", {})
+        return 1.0, "route", {
+            "route_id": route_id,
+            "driver_name": route.get("driver_name"),
+            "driver_contact": route.get("driver_contact"),
+            "pickup_start": timings.get("pickup_start"),
+            "school_reach": timings.get("school_reach"),
+            "drop_start": timings.get("drop_start"),
+        }
+
+    def _subject_exam(self, query, lang):
+        grade, exam = _grade(query), _exam_name(query) or "Half-Yearly"
+        if grade is None or not _EXAM_WORDS.search(query) or not _DATE_WORDS.search(query):
+            return None
+        doc = self.db.curriculum.find_one({"grade": grade}, {f"exam_datesheet.{exam}": 1})
+        datesheet = (doc or {}).get("exam_datesheet", {}).get(exam, {})
+        # Longest name first so "Computer Science" wins over "Science"
+        subject = next((s for s in sorted(datesheet, key=len, reverse=True) if s.lower() in query.lower()), None)
+        if subject is None:
+            return None
+        date = datesheet[subject]
+        return 1.0, "subject_exam", {"grade": grade, "exam": exam, "subject": subject, "date": date}
+
+    def _exam_window(self, query, lang):
+        exam = _exam_name(query)
+        if exam is None or not _EXAM_WORDS.search(query) or not _DATE_WORDS.search(query):
+            return None
+        doc = self.db.school_info.find_one(
+            {"category": "calendar"},
+            {"events": {"$elemMatch": {"type": "Exam", "event": {"$regex": f"^{re.escape(exam)}"}}}},
+        )
+        if not doc or not doc.get("events"):
+            return None
+        event = doc["events"][0]
+        return 1.0, "exam_window", {"event": event["event"], "start_date": event.get("start_date"),
+                                    "end_date": event.get("end_date")}
+
+    def _late_fee(self, query, lang):
+        if not _LATE_FEE.search(query):
+            return None
+        doc = self.db.school_info.find_one({"category": "policies", "title": {"$regex": "^Fee Structure"}},
+                                           {"content": 1})
+        match = re.search(r"Late Fee:\s*([^.]+)", (doc or {}).get("content", ""))
+        if not match:
+            return None
+        # Any other fee question ("late fee and tuition?") needs the full fee structure
+        confidence = 1.0 if len(re.findall(r"fee", query, re.IGNORECASE)) <= 1 else 0.6
+        return confidence, "late_fee", {"late_fee": match.group(1).strip()}
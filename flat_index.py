@@ -0,0 +1,222 @@
+"""
+Exact in-process vector index for the knowledge base, as an alternative to Chroma
+(VECTOR_BACKEND=flat).
+
+Usage:
+    python flat_index.py build                  # embed the chunks from Mongo and write the index
+    python flat_index.py build --from-chroma    # copy the vectors already stored in Chroma
+
+Layout under FLAT_INDEX_PATH: every build writes a new version directory holding
+vectors.npy (normalized float32, one row per chunk) and docstore.json (ids, texts, metadata),
+then switches the CURRENT pointer to it. Readers open vectors.npy with mmap_mode="r", so all
+worker processes share the same page-cache pages, and pick up a new build on their own.
+
+FlatVectorIndex.query() takes and returns the same shapes as a Chroma collection's query()
+(query_embeddings, n_results, where), so rag_engine.search_knowledge_chunks works unchanged.
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+FLAT_INDEX_PATH = os.getenv("FLAT_INDEX_PATH", "./flat_index")
+KEEP_VERSIONS = 2
+
+
+# ==========================================
+# 1. WRITING
+# ==========================================
+def write_index(directory, ids, texts, metadatas, embeddings):
+    """Writes a new version and points CURRENT at it. Returns the version directory."""
+    if len(ids):
+        # np.array copies, so the caller's embeddings are never normalized in place
+        vectors = np.array(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)  # An empty build is valid; queries return nothing
+
+    version = f"v{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    version_dir = os.path.join(directory, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, "vectors.npy"), vectors)
+    with open(os.path.join(version_dir, "docstore.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "texts": list(texts), "metadatas": [m or {} for m in metadatas]}, f,
+                  ensure_ascii=False)
+
+    pointer = os.path.join(directory, "CURRENT")
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    # Older versions may still be mapped by running workers; unlinking them is safe on POSIX
+    versions = sorted(d for d in os.listdir(directory) if d.startswith("v") and d != version)
+    for old in versions[:-(KEEP_VERSIONS - 1) or None]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version_dir
+
+
+# ==========================================
+# 2. QUERYING
+# ==========================================
+class _IndexState:
+    """One loaded build. Never mutated: a reload publishes a new one in a single assignment."""
+
+    __slots__ = ("version", "vectors", "docstore", "columns")
+
+    def __init__(self, version, vectors, docstore, columns):
+        self.version = version
+        self.vectors = vectors
+        self.docstore = docstore
+        self.columns = columns
+
+    def count(self):
+        return len(self.docstore["ids"])
+
+
+class FlatVectorIndex:
+    """
+    Exact top-k by dot product over normalized vectors (cosine), with metadata filters.
+    Distances are reported as squared L2 (2 - 2 * cosine), the same scale Chroma's default
+    space returns, so callers can compare them across backends.
+    """
+
+    def __init__(self, directory=FLAT_INDEX_PATH, reload_check_interval=30):
+        self.directory = directory
+        self.reload_check_interval = reload_check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._state = None
+        self._load()
+
+    def _current_version(self):
+        with open(os.path.join(self.directory, "CURRENT")) as f:
+            return f.read().strip()
+
+    def _load(self):
+        version = self._current_version()
+        version_dir = os.path.join(self.directory, version)
+        vectors = np.load(os.path.join(version_dir, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(version_dir, "docstore.json"), encoding="utf-8") as f:
+            docstore = json.load(f)
+
+        # One column per metadata key, so filters are vectorized comparisons
+        keys = {key for metadata in docstore["metadatas"] for key in metadata}
+        columns = {key: np.array([m.get(key) for m in docstore["metadatas"]], dtype=object) for key in keys}
+
+        # Queries read self._state once, so they never mix two builds
+        self._state = _IndexState(version, vectors, docstore, columns)
+        self._checked_at = time.monotonic()
+
+    def refresh(self):
+        """Switches to a newer build if one was written since the last check."""
+        if time.monotonic() - self._checked_at < self.reload_check_interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._current_version() != self._state.version:
+                self._load()
+
+    def count(self):
+        return self._state.count()
+
+    @classmethod
+    def _mask(cls, state, where):
+        """Chroma-style filter: {"field": value}, {"field": {"$in": [...]}}, {"$and": [...]}, {"$or": [...]}."""
+        mask = np.ones(state.count(), dtype=bool)
+        for field, condition in where.items():
+            if field in ("$and", "$or"):
+                parts = [cls._mask(state, clause) for clause in condition]
+                mask &= np.logical_and.reduce(parts) if field == "$and" else np.logical_or.reduce(parts)
+                continue
+            column = state.columns.get(field)
+            if column is None:
+                return np.zeros(state.count(), dtype=bool)
+            if isinstance(condition, dict):
+                (op, value), = condition.items()
+                if op == "$eq":
+                    mask &= column == value
+                elif op == "$ne":
+                    mask &= column != value
+                elif op in ("$in", "$nin"):
+                    # Membership per row; np.isin would sort the object column and fail on mixed types
+                    allowed = set(value)
+                    hits = np.fromiter((v in allowed for v in column), dtype=bool, count=len(column))
+                    mask &= hits if op == "$in" else ~hits
+                else:
+                    raise ValueError(f"Unsupported filter operator {op}")
+            else:
+                mask &= column == condition
+        return mask
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        self.refresh()
+        state = self._state
+        vectors, docstore = state.vectors, state.docstore
+        candidates = np.flatnonzero(self._mask(state, where)) if where else None
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not state.count():
+            return {key: [[] for _ in query_embeddings] for key in result}
+        for query in np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1):
+            query = query / max(np.linalg.norm(query), 1e-12)
+            rows = vectors if candidates is None else vectors[candidates]
+            scores = rows @ query
+            k = min(n_results, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+            top = top[np.argsort(-scores[top])]
+            positions = top if candidates is None else candidates[top]
+
+            result["ids"].append([docstore["ids"][i] for i in positions])
+            result["documents"].append([docstore["texts"][i] for i in positions])
+            result["metadatas"].append([docstore["metadatas"][i] for i in positions])
+            result["distances"].append([float(2 - 2 * s) for s in scores[top]])
+        return result
+
+
+# ==========================================
+# 3. BUILDING
+# ==========================================
+def build_from_mongo(db, embed_fn, directory=FLAT_INDEX_PATH, batch_size=256):
+    from ingest_knowledge import iter_knowledge_chunks
+
+    ids, texts, metadatas, embeddings, seen = [], [], [], [], set()
+    for chunk in iter_knowledge_chunks(db):
+        if chunk["id"] in seen:
+            continue
+        seen.add(chunk["id"])
+        ids.append(chunk["id"])
+        texts.append(chunk["text"])
+        metadatas.append(chunk["metadata"])
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(embed_fn(texts[start:start + batch_size]))
+    write_index(directory, ids, texts, metadatas, embeddings)
+    return len(ids)
+
+
+def build_from_chroma(collection, directory=FLAT_INDEX_PATH):
+    data = collection.get(include=["documents", "metadatas", "embeddings"])
+    write_index(directory, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+    return len(data["ids"])
+
+
+if __name__ == "__main__":
+    import rag_engine as rag
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Write a new version of the index")
+    build.add_argument("--path", default=FLAT_INDEX_PATH)
+    build.add_argument("--from-chroma", action="store_true", help="Reuse the embeddings stored in Chroma")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    os.makedirs(args.path, exist_ok=True)
+    if args.from_chroma:
+        count = build_from_chroma(rag.get_chroma_collection(), args.path)
+    else:
+        count = build_from_mongo(rag.get_mongo_db(), rag.get_embed_fn(), args.path)
+    print(f"Indexed {count} chunks into {args.path} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,207 @@
+"""
+Populates the `school_knowledge` Chroma collection from MongoDB.
+
+Usage:
+    python ingest_knowledge.py               # incremental: embed only new/changed chunks
+    python ingest_knowledge.py --full        # re-embed everything
+    python ingest_knowledge.py --dry-run     # report what would change
+
+Every chunk is keyed by a hash of its text and metadata, so unchanged chunks keep their id
+and are skipped; ids that are no longer produced are deleted as stale. The BM25 index
+(bm25_index.py) is rebuilt from the same chunks, and with VECTOR_BACKEND=flat so is the flat
+index (flat_index.py).
+"""
+import argparse
+import hashlib
+import json
+import re
+import time
+
+import rag_engine as rag
+from embeddings import embedder_id
+
+MAX_CHUNK_CHARS = 800
+DEFAULT_BATCH_SIZE = 256
+
+
+# ==========================================
+# 1. CHUNKING
+# ==========================================
+def split_text(text, max_chars=MAX_CHUNK_CHARS):
+    """Splits long text on sentence boundaries into pieces of at most ~max_chars."""
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def make_chunk(text, **metadata):
+    metadata = {k: v for k, v in metadata.items() if v is not None}
+    payload = json.dumps({"text": text, "metadata": metadata}, sort_keys=True)
+    chunk_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    return {"id": chunk_id, "text": text, "metadata": metadata}
+
+
+def policy_chunks(doc):
+    title = doc.get("title", "School Policy")
+    for idx, piece in enumerate(split_text(doc.get("content", ""))):
+        yield make_chunk(f"{title}: {piece}", category="policies", title=title, part=idx)
+
+
+def calendar_chunks(doc):
+    for event in doc.get("events", []):
+        if "start_date" in event:
+            when = f"from {event['start_date']} to {event['end_date']}"
+        else:
+            when = f"on {event['date']}"
+        closed = " School is closed." if event.get("school_closed") else ""
+        text = f"School Calendar ({event['type']}): {event['event']} {when}.{closed}"
+        yield make_chunk(text, category="calendar", title=event["event"], event_type=event["type"])
+
+
+def transport_chunks(doc):
+    for route in doc.get("routes", []):
+        timings = route.get("timings", {})
+        text = (
+            f"Bus {route['route_id']}: driver {route['driver_name']} (contact {route['driver_contact']}). "
+            f"Stops: {', '.join(route['stops'])}. "
+            f"Pickup starts {timings.get('pickup_start')}, reaches school {timings.get('school_reach')}, "
+            f"drop starts {timings.get('drop_start')}."
+        )
+        yield make_chunk(text, category="transport", title=route["route_id"])
+
+
+def curriculum_chunks(doc):
+    grade = doc["grade"]
+    for subject, chapters in doc.get("syllabus", {}).items():
+        text = f"Grade {grade} {subject} syllabus: {'; '.join(chapters)}."
+        yield make_chunk(text, category="syllabus", grade=grade, subject=subject)
+
+    for day, periods in doc.get("timetable", {}).items():
+        slots = ", ".join(f"{p['time']} {p['subject']}" for p in periods)
+        yield make_chunk(f"Grade {grade} timetable for {day}: {slots}.", category="timetable", grade=grade, day=day)
+
+    for exam, dates in doc.get("exam_datesheet", {}).items():
+        schedule = ", ".join(f"{sub} on {date}" for sub, date in sorted(dates.items(), key=lambda kv: kv[1]))
+        yield make_chunk(f"Grade {grade} {exam} exam datesheet: {schedule}.", category="exams", grade=grade, exam=exam)
+
+
+SCHOOL_INFO_CHUNKERS = {
+    "policies": policy_chunks,
+    "calendar": calendar_chunks,
+    "transport": transport_chunks,
+}
+
+
+def iter_knowledge_chunks(db):
+    """Streams chunks straight off the Mongo cursors; nothing is loaded up front."""
+    for doc in db.school_info.find({}, {"_id": 0}):
+        chunker = SCHOOL_INFO_CHUNKERS.get(doc.get("category"))
+        if chunker:
+            yield from chunker(doc)
+    for doc in db.curriculum.find({}, {"_id": 0}):
+        yield from curriculum_chunks(doc)
+
+
+# ==========================================
+# 2. INCREMENTAL UPSERT
+# ==========================================
+def existing_chunk_ids(collection, page_size=5000, embedder=None):
+    """Ids in the collection; with `embedder`, only those embedded by it (see embeddings.embedder_id)."""
+    ids = set()
+    offset = 0
+    where = {"embedder": embedder} if embedder else None
+    while True:
+        page = collection.get(include=[], where=where, limit=page_size, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < page_size:
+            return ids
+        offset += page_size
+
+
+def _flush(collection, embed_fn, batch, embedder):
+    texts = [c["text"] for c in batch]
+    collection.upsert(
+        ids=[c["id"] for c in batch],
+        documents=texts,
+        metadatas=[{**c["metadata"], "embedder": embedder} for c in batch],
+        embeddings=embed_fn(texts),
+    )
+
+
+def ingest(db, collection, embed_fn, batch_size=DEFAULT_BATCH_SIZE, full=False, dry_run=False):
+    """
+    Syncs `collection` with the chunks produced from `db`.
+    A chunk counts as unchanged only if it was embedded by `embed_fn`'s backend and model, so
+    switching EMBED_BACKEND re-embeds everything on the next run.
+    Returns counts of embedded, unchanged and deleted chunks.
+    """
+    embedder = embedder_id(embed_fn)
+    stored = existing_chunk_ids(collection)
+    existing = set() if full else existing_chunk_ids(collection, embedder=embedder)
+    seen = set()
+    batch = []
+    stats = {"embedded": 0, "unchanged": 0, "deleted": 0}
+
+    for chunk in iter_knowledge_chunks(db):
+        if chunk["id"] in seen:
+            continue
+        seen.add(chunk["id"])
+        if chunk["id"] in existing:
+            stats["unchanged"] += 1
+            continue
+
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            if not dry_run:
+                _flush(collection, embed_fn, batch, embedder)
+            stats["embedded"] += len(batch)
+            batch = []
+
+    if batch:
+        if not dry_run:
+            _flush(collection, embed_fn, batch, embedder)
+        stats["embedded"] += len(batch)
+
+    stale = list(stored - seen)
+    for start in range(0, len(stale), batch_size):
+        if not dry_run:
+            collection.delete(ids=stale[start:start + batch_size])
+    stats["deleted"] = len(stale)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--full", action="store_true", help="Re-embed every chunk, even unchanged ones")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = ingest(rag.get_mongo_db(), rag.get_chroma_collection(), rag.get_embed_fn(),
+                   batch_size=args.batch_size, full=args.full, dry_run=args.dry_run)
+
+    print("----------------------------------------------------------------")
+    print("KNOWLEDGE INGESTION COMPLETE" + (" (dry run)" if args.dry_run else ""))
+    print(f"1. Embedded (new/changed): {stats['embedded']}")
+    print(f"2. Unchanged (skipped): {stats['unchanged']}")
+    print(f"3. Deleted (stale): {stats['deleted']}")
+    if not args.dry_run:
+        from bm25_index import build_bm25, write_bm25
+        bm25 = build_bm25(iter_knowledge_chunks(rag.get_mongo_db()))
+        write_bm25(bm25)
+        print(f"4. BM25 index rebuilt: {len(bm25['ids'])} chunks")
+    if rag.VECTOR_BACKEND == "flat" and not args.dry_run:
+        from flat_index import build_from_chroma
+        print(f"5. Flat index rebuilt: {build_from_chroma(rag.get_chroma_collection())} chunks")
+    print(f"Took {time.perf_counter() - start:.1f}s")
+    print("----------------------------------------------------------------")
@@ -0,0 +1,196 @@
+"""
+Interaction log: one document per answered query in the `interactions` collection, plus
+query-frequency analytics over it.
+
+Usage:
+    python interaction_log.py                     # top questions of the last 7 days
+    python interaction_log.py --days 30 --top 50
+    python interaction_log.py --days 2 --bucket hour
+
+Logging never touches Mongo on the request path: log() only enqueues, and a background thread
+drains the bounded queue with insert_many. When the queue is full (Mongo down or too slow),
+entries are dropped and counted in `edubot_interactions_dropped_total` instead of blocking.
+Entries come from finished request traces (metrics.add_finish_listener); the entry points
+attach the query, the resolved student and the answer with trace.attach().
+"""
+import argparse
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from metrics import REGISTRY
+from name_resolver import normalize_name
+
+INTERACTION_QUEUE_SIZE = int(os.getenv("INTERACTION_QUEUE_SIZE", "10000"))
+INTERACTION_BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", "200"))
+INTERACTION_FLUSH_SECONDS = float(os.getenv("INTERACTION_FLUSH_SECONDS", "1.0"))
+
+
+# ==========================================
+# 1. ASYNC BATCHED WRITER
+# ==========================================
+class InteractionLogger:
+    def __init__(self, collection, max_queue=INTERACTION_QUEUE_SIZE, batch_size=INTERACTION_BATCH_SIZE,
+                 flush_interval=INTERACTION_FLUSH_SECONDS):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            REGISTRY.inc("edubot_interactions_dropped_total", help_text="Interaction log entries dropped on a full queue")
+
+    def on_trace_finished(self, trace, line):
+        """metrics finish listener: turns a finished request trace into an interaction entry."""
+        query = trace.payload.get("query")
+        if not query:
+            return
+        self.log({
+            "ts": datetime.now(timezone.utc),
+            "request_id": trace.request_id,
+            "source": trace.source,
+            "status": line["status"],
+            "query": query,
+            "query_norm": normalize_name(query),
+            "student": trace.payload.get("student"),
+            "intents": trace.attrs.get("intents"),
+            "chunk_ids": trace.attrs.get("chunk_ids"),
+            "cache_hit": trace.attrs.get("cache_hit", False),
+            "fast_path": trace.attrs.get("fast_path"),
+            "stages_ms": line["stages_ms"],
+            "total_ms": line["total_ms"],
+            "answer": trace.payload.get("answer"),
+            "error": line.get("error"),
+        })
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                try:
+                    self.collection.insert_many(batch, ordered=False)
+                    REGISTRY.inc("edubot_interactions_logged_total", len(batch), help_text="Interaction log entries written")
+                except Exception:
+                    REGISTRY.inc("edubot_interactions_failed_total", len(batch),
+                                 help_text="Interaction log entries lost to a failed insert")
+            if stop:
+                return
+
+    def close(self, timeout=5.0):
+        """Flushes what is queued (best effort, at most `timeout` seconds)."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+# ==========================================
+# 2. ANALYTICS
+# ==========================================
+def top_questions(collection, since, limit=20):
+    """Most frequent questions (normalized text) since `since`, with how they were answered."""
+    return list(collection.aggregate([
+        {"$match": {"ts": {"$gte": since}, "status": "ok"}},
+        {"$group": {
+            "_id": "$query_norm",
+            "count": {"$sum": 1},
+            "example": {"$first": "$query"},
+            "student_queries": {"$sum": {"$cond": [{"$ifNull": ["$student", False]}, 1, 0]}},
+            "cache_hits": {"$sum": {"$cond": ["$cache_hit", 1, 0]}},
+            "fast_path": {"$sum": {"$cond": [{"$ifNull": ["$fast_path", False]}, 1, 0]}},
+            "avg_ms": {"$avg": "$total_ms"},
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ], allowDiskUse=True))
+
+
+def cache_candidates(collection, since, min_count=3, limit=20):
+    """
+    General questions that keep going to Gemini: asked at least `min_count` times and answered
+    by neither the answer cache nor the fast path. Candidates for a fast-path rule or a lower
+    cache threshold.
+    """
+    return list(collection.aggregate([
+        {"$match": {"ts": {"$gte": since}, "status": "ok", "student": None,
+                    "cache_hit": False, "fast_path": None}},
+        {"$group": {"_id": "$query_norm", "count": {"$sum": 1}, "example": {"$first": "$query"},
+                    "avg_ms": {"$avg": "$total_ms"}, "intents": {"$first": "$intents"}}},
+        {"$match": {"count": {"$gte": min_count}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ], allowDiskUse=True))
+
+
+BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}
+
+
+def volume_by_bucket(collection, since, bucket="day"):
+    """Query volume per hour/day, split by how the answer was produced."""
+    return list(collection.aggregate([
+        {"$match": {"ts": {"$gte": since}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": BUCKET_FORMATS[bucket], "date": "$ts"}},
+            "queries": {"$sum": 1},
+            "cache_hits": {"$sum": {"$cond": ["$cache_hit", 1, 0]}},
+            "fast_path": {"$sum": {"$cond": [{"$ifNull": ["$fast_path", False]}, 1, 0]}},
+            "errors": {"$sum": {"$cond": [{"$eq": ["$status", "ok"]}, 0, 1]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]))
+
+
+if __name__ == "__main__":
+    import rag_engine as rag
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--min-count", type=int, default=3, help="Minimum repeats for a cache candidate")
+    parser.add_argument("--bucket", choices=list(BUCKET_FORMATS), default="day")
+    args = parser.parse_args()
+
+    interactions = rag.get_mongo_db().interactions
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    print(f"=== Volume per {args.bucket} (last {args.days:g} days) ===")
+    print(f"{'bucket':<18}{'queries':>9}{'cached':>9}{'fast':>9}{'errors':>9}")
+    for row in volume_by_bucket(interactions, since, args.bucket):
+        print(f"{row['_id']:<18}{row['queries']:>9}{row['cache_hits']:>9}{row['fast_path']:>9}{row['errors']:>9}")
+
+    print(f"\n=== Top {args.top} questions ===")
+    print(f"{'count':>6}{'student':>9}{'cached':>8}{'fast':>6}{'avg ms':>9}  question")
+    for row in top_questions(interactions, since, args.top):
+        print(f"{row['count']:>6}{row['student_queries']:>9}{row['cache_hits']:>8}{row['fast_path']:>6}"
+              f"{row['avg_ms']:>9.0f}  {row['example']}")
+
+    print(f"\n=== Cache / fast-path candidates (general, asked >= {args.min_count}x, always sent to Gemini) ===")
+    for row in cache_candidates(interactions, since, args.min_count, args.top):
+        print(f"{row['count']:>6}x {row['avg_ms']:>7.0f} ms  {row['example']}  intents={row['intents']}")
@@ -0,0 +1,46 @@
+import time
+
+
+class StreamedReply:
+    """
+    Wraps a streaming Gemini call so callers can render chunks as they arrive.
+    - Iterate over it to receive text chunks in generation order.
+    - After iteration, `text` holds the full answer and the timings are filled in.
+    - `on_complete(text)` runs once the stream has finished (e.g. to record history).
+    """
+
+    def __init__(self, start_stream, on_complete=None):
+        self.start_stream = start_stream
+        self.on_complete = on_complete
+        self.parts = []
+        self.time_to_first_token = None
+        self.total_time = None
+        self.usage_metadata = None
+
+    def __iter__(self):
+        start = time.perf_counter()
+        response = self.start_stream()
+
+        for chunk in response:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. the final finish_reason chunk)
+                continue
+            if not chunk_text:
+                continue
+
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - start
+            self.parts.append(chunk_text)
+            yield chunk_text
+
+        self.total_time = time.perf_counter() - start
+        # Token counts are filled in on the response once the stream is exhausted
+        self.usage_metadata = getattr(response, "usage_metadata", None)
+        if self.on_complete:
+            self.on_complete(self.text)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
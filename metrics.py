@@ -0,0 +1,289 @@
+"""
+Lightweight per-request tracing and histogram metrics for the query path.
+
+- Wrap a stage with `timed("vector_query")`; the duration goes into the
+  `edubot_stage_seconds` histogram and into the current request trace (if one is active).
+- `start_trace()` / `trace.finish()` bracket one parent query and emit one JSON log line.
+- `render_prometheus()` returns the Prometheus text format; expose it with
+  `start_http_exporter(port)` or write it periodically with `start_file_exporter(path)`.
+
+Everything is in-process (a few dict updates under a lock), so it can stay on in production.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("edubot.requests")
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+TOKEN_BUCKETS = [50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000]
+
+
+# ==========================================
+# 1. METRIC TYPES
+# ==========================================
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> float
+        self._help = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, ("histogram", help_text))
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(name, ("counter", help_text))
+
+    def render_prometheus(self):
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{fmt_labels(labels)} {value}")
+                    continue
+                for (metric, labels), hist in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ["+Inf"], hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def render_prometheus():
+    return REGISTRY.render_prometheus()
+
+
+# ==========================================
+# 2. REQUEST TRACES
+# ==========================================
+_current_trace = contextvars.ContextVar("edubot_trace", default=None)
+_finish_listeners = []
+
+
+def add_finish_listener(listener):
+    """listener(trace, line) runs after every trace.finish(); it must not block."""
+    if listener not in _finish_listeners:
+        _finish_listeners.append(listener)
+
+
+class RequestTrace:
+    """Timings and attributes for one parent query; finish() exports them."""
+
+    def __init__(self, source):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.attrs = {}
+        self.payload = {}  # handed to finish listeners only, never written to the request log
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def set(self, **attrs):
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def attach(self, **payload):
+        """Data for finish listeners (e.g. the query and answer text) that stays out of the log line."""
+        with self._lock:
+            self.payload.update(payload)
+
+    def finish(self, status="ok", error=None):
+        if self._finished:
+            return
+        self._finished = True
+        total = time.perf_counter() - self.started
+        REGISTRY.observe("edubot_request_seconds", total, help_text="End-to-end query latency", source=self.source, status=status)
+        REGISTRY.inc("edubot_requests_total", help_text="Parent queries handled", source=self.source, status=status)
+        for kind in ("prompt_tokens", "response_tokens"):
+            if self.attrs.get(kind) is not None:
+                REGISTRY.observe("edubot_llm_tokens", self.attrs[kind], buckets=TOKEN_BUCKETS,
+                                 help_text="Gemini token counts per request", kind=kind)
+
+        line = {
+            "request_id": self.request_id,
+            "source": self.source,
+            "status": status,
+            "total_ms": round(total * 1000, 1),
+            "stages_ms": {k: round(v * 1000, 1) for k, v in self.stages.items()},
+            **self.attrs,
+        }
+        if error:
+            line["error"] = str(error)
+        logger.info(json.dumps(line, default=str, ensure_ascii=False))
+        for listener in _finish_listeners:
+            listener(self, line)
+
+
+def start_trace(source):
+    trace = RequestTrace(source)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(stage, seconds):
+    REGISTRY.observe("edubot_stage_seconds", seconds, help_text="Latency of each query-path stage", stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_llm(reply, prompt_text=""):
+    """Records time-to-first-token, generation time and token counts from a finished StreamedReply."""
+    from context_builder import estimate_tokens
+
+    if reply.time_to_first_token is not None:
+        record_stage("llm_first_token", reply.time_to_first_token)
+    if reply.total_time is not None:
+        record_stage("llm_total", reply.total_time)
+
+    usage = reply.usage_metadata
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt_text)
+    response_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(reply.text)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.set(prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+
+# ==========================================
+# 3. EXPORTERS
+# ==========================================
+_exporters_started = set()
+_exporters_lock = threading.Lock()
+
+
+def start_http_exporter(port=None):
+    """Serves /metrics on `port` (default METRICS_PORT) from a daemon thread. Idempotent."""
+    port = int(port or os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _exporters_lock:
+        if ("http", port) in _exporters_started:
+            return None
+        _exporters_started.add(("http", port))
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_exporter(path=None, interval=15):
+    """Rewrites `path` (default METRICS_FILE) with the Prometheus text every `interval` seconds."""
+    path = path or os.getenv("METRICS_FILE")
+    if not path:
+        return None
+    with _exporters_lock:
+        if ("file", path) in _exporters_started:
+            return None
+        _exporters_started.add(("file", path))
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(render_prometheus())
+            os.replace(tmp_path, path)
+
+    thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+def configure_request_log():
+    """Per-request JSON lines go to REQUEST_LOG_FILE, or stderr when it is not set."""
+    if logger.handlers:
+        return
+    path = os.getenv("REQUEST_LOG_FILE")
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start_exporters():
+    """Sets up the request log and whichever exporters METRICS_PORT / METRICS_FILE configure."""
+    configure_request_log()
+    start_http_exporter()
+    start_file_exporter()
@@ -0,0 +1,74 @@
+import pymongo
+from pymongo import ASCENDING, UpdateOne
+
+from name_resolver import name_fields
+from transcript_store import TRANSCRIPT_TTL_HOURS
+
+
+def backfill_name_fields(db, batch_size=1000):
+    """
+    Adds name_norm / first_name_norm to students that were inserted before these fields existed.
+    """
+    ops = []
+    updated = 0
+    for student in db.students.find({"name_norm": {"$exists": False}}, {"name": 1}):
+        ops.append(UpdateOne({"_id": student["_id"]}, {"$set": name_fields(student.get("name", ""))}))
+        if len(ops) >= batch_size:
+            updated += db.students.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.students.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+def ensure_indexes(db):
+    """
+    Creates the secondary indexes the retrieval path relies on. Safe to run repeatedly.
+    """
+    db.students.create_index([("name_norm", ASCENDING)], name="name_norm")
+    db.students.create_index([("first_name_norm", ASCENDING)], name="first_name_norm")
+    # $lookup targets used by get_student_info
+    db.academic_records.create_index([("student_id", ASCENDING)], name="student_id", unique=True)
+    db.curriculum.create_index([("grade", ASCENDING)], name="grade")
+    # Fast-path lookups (fast_path.py): school_info by category and bus routes by id
+    db.school_info.create_index([("category", ASCENDING)], name="category")
+    db.school_info.create_index([("routes.route_id", ASCENDING)], name="routes_route_id")
+    # Digest lookups (student_digest.py) and the updated_at keys its delta job scans
+    db.student_digest.create_index([("name_norm", ASCENDING)], name="name_norm")
+    db.student_digest.create_index([("first_name_norm", ASCENDING)], name="first_name_norm")
+    db.student_digest.create_index([("academic_record_id", ASCENDING)], name="academic_record_id")
+    db.student_digest.create_index([("next_due_date", ASCENDING)], name="next_due_date")
+    for source in ("students", "academic_records", "curriculum"):
+        db[source].create_index([("updated_at", ASCENDING)], name="updated_at")
+    # Interaction analytics (interaction_log.py) scan by time window
+    db.interactions.create_index([("ts", ASCENDING)], name="ts")
+    # One report per student per batch run (progress_reports.py resumes from these)
+    db.progress_reports.create_index([("run_id", ASCENDING), ("student_id", ASCENDING)], name="run_student", unique=True)
+    # Spilled chat messages (transcript_store.py, TRANSCRIPT_STORE=mongo): paged by session, expired by TTL
+    db.session_transcripts.create_index([("session_id", ASCENDING), ("seq", ASCENDING)], name="session_seq")
+    db.session_transcripts.create_index([("ts", ASCENDING)], name="ts_ttl",
+                                        expireAfterSeconds=int(TRANSCRIPT_TTL_HOURS * 3600))
+
+
+def migrate(db):
+    from student_digest import DigestRefresher
+
+    updated = backfill_name_fields(db)
+    ensure_indexes(db)
+    digested = DigestRefresher(db).rebuild()
+    return updated, digested
+
+
+if __name__ == "__main__":
+    client = pymongo.MongoClient("mongodb://localhost:27017/")
+    db = client["school_rag_db"]
+
+    updated, digested = migrate(db)
+    print("----------------------------------------------------------------")
+    print("MIGRATION COMPLETE")
+    print(f"1. Students backfilled with normalized names: {updated}")
+    print("2. Indexes ensured on students (name_norm, first_name_norm), academic_records.student_id, curriculum.grade,")
+    print("   school_info (category, routes.route_id), student_digest, updated_at, interactions.ts, progress_reports (run_id, student_id),")
+    print("   session_transcripts (session_id, seq; TTL on ts)")
+    print(f"3. Student digests rebuilt: {digested}")
+    print("----------------------------------------------------------------")
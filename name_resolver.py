@@ -0,0 +1,260 @@
+import re
+import threading
+import time
+import unicodedata
+
+from pymongo.errors import PyMongoError
+
+
+def normalize_name(text):
+    """
+    Lowercases, strips accents and collapses everything that is not a letter/digit
+    into single spaces, so "Aarav  SHARMA!" and "aarav sharma" compare equal.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[\W_]+", " ", text.casefold())
+    return text.strip()
+
+
+def name_fields(full_name):
+    """Normalized fields stored on every student document for indexed exact lookups."""
+    name_norm = normalize_name(full_name)
+    return {
+        "name_norm": name_norm,
+        "first_name_norm": name_norm.split(" ")[0] if name_norm else "",
+    }
+
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        # normalized pattern that ends at this node, if any
+        self.terminal = None
+
+
+class NameTrie:
+    """
+    Word-level trie over normalized names.
+    Matching walks the query tokens once per start position, so the cost depends on
+    the query length, not on the number of students.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.counts = {}
+
+    def add(self, pattern):
+        self.counts[pattern] = self.counts.get(pattern, 0) + 1
+        if self.counts[pattern] > 1:
+            return
+        node = self.root
+        for token in pattern.split(" "):
+            node = node.children.setdefault(token, _TrieNode())
+        node.terminal = pattern
+
+    def remove(self, pattern):
+        count = self.counts.get(pattern, 0)
+        if count == 0:
+            return
+        if count > 1:
+            self.counts[pattern] = count - 1
+            return
+        del self.counts[pattern]
+
+        # Unmark the terminal and prune nodes that no longer lead anywhere
+        path = [self.root]
+        tokens = pattern.split(" ")
+        for token in tokens:
+            path.append(path[-1].children[token])
+        path[-1].terminal = None
+        for depth in range(len(tokens), 0, -1):
+            node = path[depth]
+            if node.children or node.terminal:
+                break
+            del path[depth - 1].children[tokens[depth - 1]]
+
+    def find_all(self, text):
+        """Returns (start_token, pattern) for every pattern that occurs as whole words in `text`."""
+        tokens = normalize_name(text).split(" ")
+        hits = []
+        for start in range(len(tokens)):
+            node = self.root
+            for token in tokens[start:]:
+                node = node.children.get(token)
+                if node is None:
+                    break
+                if node.terminal:
+                    hits.append((start, node.terminal))
+        return hits
+
+
+class StudentNameResolver:
+    """
+    Finds student names mentioned in a parent's query using the live `students` collection.
+    - Full names and first names are loaded into a NameTrie once.
+    - refresh() applies only what changed since the last call (change stream when the
+      deployment supports it, otherwise a periodic reload of the name projection).
+    - Reloads after the first one build a new trie on a background thread and swap it in
+      when complete; queries keep matching against the previous one meanwhile.
+    """
+
+    def __init__(self, students_collection, reload_interval=300, poll_interval=1.0):
+        self.students = students_collection
+        self.reload_interval = reload_interval
+        # Minimum time between change-stream polls (each one is a getMore round trip)
+        self.poll_interval = poll_interval
+        self._polled_at = 0.0
+        # (NameTrie, {student_id: name fields}), replaced in one assignment by a full reload
+        self._index = (NameTrie(), {})
+        self._lock = threading.Lock()
+        self._stream = None
+        self._loaded_at = None
+        self._stale = False
+        self._reloading = False
+
+    # --- Building the matcher ---
+    @classmethod
+    def _add_student(cls, index, student_id, full_name):
+        cls._remove_student(index, student_id)
+        fields = name_fields(full_name)
+        if not fields["name_norm"]:
+            return
+        trie, names_by_id = index
+        names_by_id[student_id] = fields
+        trie.add(fields["name_norm"])
+        trie.add(fields["first_name_norm"])
+
+    @staticmethod
+    def _remove_student(index, student_id):
+        trie, names_by_id = index
+        fields = names_by_id.pop(student_id, None)
+        if fields:
+            trie.remove(fields["name_norm"])
+            trie.remove(fields["first_name_norm"])
+
+    def _load_index(self):
+        """A new (trie, names_by_id) from the name projection; the live index is not touched."""
+        index = (NameTrie(), {})
+        for student in self.students.find({}, {"name": 1}):
+            self._add_student(index, student["_id"], student.get("name", ""))
+        return index
+
+    def _start_reload(self):
+        # Called with the lock held
+        self._reloading = True
+        self._stale = False
+        if self._stream is None:
+            # Open the stream first so nothing is missed between the load and the watch
+            self._open_change_stream()
+        threading.Thread(target=self._reload_in_background, name="name-reload", daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            index = self._load_index()
+        except PyMongoError:
+            index = None
+        with self._lock:
+            if index is None:
+                # Keep the old names; retry on the periodic reload
+                self._close_stream()
+            else:
+                self._index = index
+            self._loaded_at = time.monotonic()
+            self._reloading = False
+
+    def _open_change_stream(self):
+        try:
+            self._stream = self.students.watch(full_document="updateLookup")
+        except (PyMongoError, NotImplementedError):
+            # Standalone mongod (change streams need a replica set) or an in-memory stand-in
+            self._stream = None
+
+    def _apply_change(self, change):
+        op = change["operationType"]
+        # drop/rename/invalidate events carry no documentKey
+        student_id = change.get("documentKey", {}).get("_id")
+        if op == "delete":
+            self._remove_student(self._index, student_id)
+        elif op in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc:
+                self._add_student(self._index, student_id, doc.get("name", ""))
+        elif op in ("drop", "invalidate", "rename", "dropDatabase"):
+            # The stream is closed after these; rebuild (and reopen it) on the next refresh()
+            self._close_stream()
+            self._stale = True
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except PyMongoError:
+                pass
+
+    def refresh(self):
+        with self._lock:
+            if self._loaded_at is None:
+                # First load: there is nothing to match against yet, so the caller waits for it
+                self._open_change_stream()
+                self._index = self._load_index()
+                self._loaded_at = time.monotonic()
+                return
+
+            if self._reloading:
+                # Stream changes wait in the stream and are applied on top of the new index
+                return
+            if self._stale or (self._stream is None
+                               and time.monotonic() - self._loaded_at > self.reload_interval):
+                self._start_reload()
+                return
+
+            if self._stream is not None:
+                now = time.monotonic()
+                if now - self._polled_at < self.poll_interval:
+                    return
+                self._polled_at = now
+                try:
+                    # _apply_change closes the stream on drop/rename/invalidate; stop reading then
+                    while self._stream is not None:
+                        change = self._stream.try_next()
+                        if change is None:
+                            break
+                        self._apply_change(change)
+                except PyMongoError:
+                    self._close_stream()
+                    self._stale = True
+
+    # --- Query side ---
+    def find_names(self, query):
+        """
+        Returns the normalized names mentioned in `query`, longest match first.
+        A full-name match ("aarav sharma") hides the first-name match it contains ("aarav").
+        """
+        self.refresh()
+        trie, _ = self._index
+        hits = trie.find_all(query)
+
+        # Keep the longest pattern per start position, then drop matches nested in a longer one
+        best = {}
+        for start, pattern in hits:
+            if len(pattern) > len(best.get(start, "")):
+                best[start] = pattern
+        found = []
+        covered_until = -1
+        for start in sorted(best):
+            pattern = best[start]
+            end = start + pattern.count(" ")
+            if end <= covered_until:
+                continue
+            found.append(pattern)
+            covered_until = end
+        return sorted(found, key=lambda p: -len(p))
+
+    def resolve(self, query):
+        """Most specific student name in the query, or None."""
+        names = self.find_names(query)
+        return names[0] if names else None
@@ -0,0 +1,348 @@
+"""
+Batch generation of PTM progress reports, one per student.
+
+Usage:
+    python progress_reports.py --run-id ptm-2024-11
+    python progress_reports.py --run-id ptm-2024-11 --grade 8 --concurrency 16 --rpm 600
+    python progress_reports.py --run-id ptm-2024-11 --out reports/ptm-2024-11.jsonl
+    python progress_reports.py --run-id test --fake-llm --limit 50
+
+Students are streamed from Mongo in _id order with their records joined in the same
+aggregation. Gemini is called from a bounded worker pool behind a shared requests-per-minute
+limiter; rate-limit and transient errors are retried with exponential backoff, and a 429 pauses
+every worker, not just the one that hit it. Finished reports are written in bulk to the
+`progress_reports` collection (or a JSONL file). The output doubles as the checkpoint:
+re-running with the same --run-id skips every student that already has a report.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import rag_engine as rag
+from prompts import SYSTEM_INSTRUCTIONS
+
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "8"))
+REPORT_RPM = float(os.getenv("REPORT_RPM", "300"))
+REPORT_MAX_RETRIES = int(os.getenv("REPORT_MAX_RETRIES", "5"))
+REPORT_FLUSH_SIZE = 50
+
+REPORT_PROMPT = """Write a progress summary for the parent-teacher meeting using only this student record.
+Cover: overall performance with the strongest and weakest subjects, attendance against the 75% requirement,
+pending assignments, and one or two concrete suggestions for the parents. Keep it under 200 words, in English.
+
+STUDENT RECORD:
+{info}"""
+
+
+# ==========================================
+# 1. RATE LIMITING & RETRIES
+# ==========================================
+class RateLimiter:
+    """
+    Spaces calls evenly to stay under `rpm` requests per minute across all workers.
+    pause(seconds) holds every caller back, e.g. after the API answered 429.
+    """
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def error_kind(error):
+    """'rate_limit', 'transient' or None (not worth retrying)."""
+    code = getattr(error, "code", None)
+    name = type(error).__name__
+    if code == 429 or name in ("ResourceExhausted", "TooManyRequests"):
+        return "rate_limit"
+    if code in (500, 502, 503, 504) or name in ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+                                                "TimeoutError", "ConnectionError"):
+        return "transient"
+    return None
+
+
+def call_with_retries(fn, limiter, max_retries=REPORT_MAX_RETRIES, base_delay=2.0, max_delay=60.0, on_retry=None):
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            kind = error_kind(e)
+            if kind is None or attempt == max_retries:
+                raise
+            # Full jitter keeps the workers from retrying in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if kind == "rate_limit":
+                limiter.pause(delay)
+            if on_retry:
+                on_retry(kind)
+            time.sleep(delay)
+
+
+# ==========================================
+# 2. REPORT SINKS (output + checkpoint)
+# ==========================================
+class MongoReportSink:
+    def __init__(self, db, run_id):
+        self.collection = db.progress_reports
+        self.run_id = run_id
+
+    def completed_ids(self):
+        return {doc["student_id"] for doc in self.collection.find({"run_id": self.run_id}, {"student_id": 1, "_id": 0})}
+
+    def write(self, reports):
+        from pymongo import UpdateOne
+
+        ops = [UpdateOne({"run_id": self.run_id, "student_id": r["student_id"]}, {"$set": r}, upsert=True)
+               for r in reports]
+        self.collection.bulk_write(ops, ordered=False)
+
+
+class JsonlReportSink:
+    def __init__(self, path, run_id):
+        self.path = path
+        self.run_id = run_id
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._drop_partial_line()
+
+    def _drop_partial_line(self):
+        """
+        A run killed mid-write can leave a last line without its newline; appending after it would
+        glue the next report onto it. Truncates the file back to its last complete line.
+        """
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            if not end:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            # Scan back in blocks for the last complete line
+            position = end
+            while position > 0:
+                block_start = max(0, position - 65536)
+                f.seek(block_start)
+                newline = f.read(position - block_start).rfind(b"\n")
+                if newline != -1:
+                    f.truncate(block_start + newline + 1)
+                    return
+                position = block_start
+            f.truncate(0)
+
+    def completed_ids(self):
+        if not os.path.exists(self.path):
+            return set()
+        done = set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    report = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by an interruption
+                if report.get("run_id") == self.run_id:
+                    done.add(report["student_id"])
+        return done
+
+    def write(self, reports):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for report in reports:
+                f.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# ==========================================
+# 3. BATCH RUN
+# ==========================================
+def iter_students(db, grade=None, section=None, batch_size=200):
+    """Students with their joined records, in _id order, streamed from one cursor."""
+    match = {}
+    if grade is not None:
+        match["grade"] = grade
+    if section:
+        match["section"] = section
+    pipeline = [{"$match": match}, {"$sort": {"_id": 1}}, *rag.student_record_stages()]
+    for student in db.students.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True):
+        yield student["_id"], rag.flatten_student_record(student)
+
+
+class ReportRun:
+    def __init__(self, model, sink, run_id, concurrency=REPORT_CONCURRENCY, rpm=REPORT_RPM,
+                 max_retries=REPORT_MAX_RETRIES, flush_size=REPORT_FLUSH_SIZE, model_name="gemini-2.0-flash"):
+        self.model = model
+        self.sink = sink
+        self.run_id = run_id
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rpm)
+        self.max_retries = max_retries
+        self.flush_size = flush_size
+        self.model_name = model_name
+
+        self.pending = []
+        self.stats = {"done": 0, "skipped": 0, "failed": 0, "retries": 0}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def _count_retry(self, kind):
+        with self._lock:
+            self.stats["retries"] += 1
+
+    def generate(self, student_id, record):
+        prompt = REPORT_PROMPT.format(info=rag.format_student_info(record, include_curriculum=False))
+        response = call_with_retries(lambda: self.model.generate_content(prompt), self.limiter,
+                                     max_retries=self.max_retries, on_retry=self._count_retry)
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "run_id": self.run_id,
+            "student_id": student_id,
+            "name": record["name"],
+            "grade": record["grade"],
+            "section": record["section"],
+            "report": response.text,
+            "model": self.model_name,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "response_tokens": getattr(usage, "candidates_token_count", None),
+            "generated_at": datetime.now(timezone.utc),
+        }
+
+    def _collect(self, future, student_id):
+        try:
+            report = future.result()
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.failures[student_id] = str(e)
+            return
+        self.pending.append(report)
+        self.stats["done"] += 1
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.sink.write(self.pending)
+            self.pending = []
+
+    def run(self, students, total=None, limit=None, progress_every=5.0):
+        completed = self.sink.completed_ids()
+        start = time.monotonic()
+        last_progress = start
+
+        def progress(final=False):
+            elapsed = time.monotonic() - start
+            rate = self.stats["done"] / elapsed * 60 if elapsed else 0.0
+            remaining = total - len(completed) if total is not None else None
+            if limit is not None:
+                remaining = min(remaining, limit) if remaining is not None else limit
+            of_total = f"/{max(remaining, 0)}" if remaining is not None else ""
+            print(f"{'Finished' if final else 'Progress'}: {self.stats['done']}{of_total} reports, "
+                  f"{self.stats['failed']} failed, {self.stats['retries']} retries, "
+                  f"{rate:.0f} reports/min, {elapsed:.0f}s elapsed")
+
+        in_flight = {}
+        submitted = 0
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="report")
+        try:
+            for student_id, record in students:
+                if student_id in completed:
+                    self.stats["skipped"] += 1
+                    continue
+                if limit is not None and submitted >= limit:
+                    break
+                # Keep at most 2x concurrency queued, so memory stays flat on large runs
+                while len(in_flight) >= self.concurrency * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future, in_flight.pop(future))
+                in_flight[pool.submit(self.generate, student_id, record)] = student_id
+                submitted += 1
+
+                if time.monotonic() - last_progress >= progress_every:
+                    progress()
+                    last_progress = time.monotonic()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._collect(future, in_flight.pop(future))
+        finally:
+            # Whatever finished before an interruption is kept, so the next run resumes after it
+            pool.shutdown(wait=False, cancel_futures=True)
+            for future in [f for f in in_flight if f.done() and not f.cancelled()]:
+                self._collect(future, in_flight.pop(future))
+            self.flush()
+        progress(final=True)
+        return self.stats
+
+
+def make_model(fake_llm=False):
+    if fake_llm:
+        from benchmarks.fakes import FakeLLM
+        return FakeLLM(first_token_latency=0.2, chunk_latency=0.0)
+
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise ValueError("API_KEY not found in environment variables. Please set it before running the application.")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_INSTRUCTIONS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run-id", required=True, help="Reports and the resume checkpoint are keyed by this id")
+    parser.add_argument("--grade", type=int)
+    parser.add_argument("--section")
+    parser.add_argument("--limit", type=int, help="Stop after this many students (for trial runs)")
+    parser.add_argument("--concurrency", type=int, default=REPORT_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=REPORT_RPM, help="Gemini requests per minute across all workers")
+    parser.add_argument("--max-retries", type=int, default=REPORT_MAX_RETRIES)
+    parser.add_argument("--out", help="Write JSONL here instead of the progress_reports collection")
+    parser.add_argument("--fake-llm", action="store_true", help="Use benchmarks.fakes.FakeLLM instead of Gemini")
+    args = parser.parse_args()
+
+    db = rag.get_mongo_db()
+    sink = JsonlReportSink(args.out, args.run_id) if args.out else MongoReportSink(db, args.run_id)
+    count_filter = {k: v for k, v in (("grade", args.grade), ("section", args.section)) if v is not None}
+    total = db.students.count_documents(count_filter)
+
+    run = ReportRun(make_model(args.fake_llm), sink, args.run_id, concurrency=args.concurrency, rpm=args.rpm,
+                    max_retries=args.max_retries)
+    print(f"Generating progress reports for run '{args.run_id}' ({total} students, {args.concurrency} workers, "
+          f"{args.rpm:.0f} requests/min)...")
+    try:
+        stats = run.run(iter_students(db, args.grade, args.section), total=total, limit=args.limit)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Finished reports were saved; re-run with the same --run-id to resume.")
+        raise SystemExit(1)
+
+    print("----------------------------------------------------------------")
+    print(f"Reports written: {stats['done']}  Already done: {stats['skipped']}  Failed: {stats['failed']}")
+    for student_id, error in list(run.failures.items())[:10]:
+        print(f"  {student_id}: {error}")
+    if run.failures:
+        print("Re-run with the same --run-id to retry the failed students.")
+    print("----------------------------------------------------------------")
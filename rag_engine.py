@@ -1,33 +1,207 @@
-import pymongo
-import chromadb
-from chromadb.utils import embedding_functions
+import contextlib
+import contextvars
+import hashlib
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from name_resolver import StudentNameResolver, normalize_name
+from metrics import REGISTRY, timed
+from student_digest import digest_to_record
 
-# SETUP DATABASES
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-mongo_db = mongo_client["school_rag_db"]
+# ==========================================
+# LAZY RESOURCES
+# ==========================================
+# Nothing heavy happens at import time. Each resource is created on first use and then shared
+# by every caller in the process (all Streamlit sessions and reruns included).
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "school_rag_db")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+# "chroma" (persistent HNSW) or "flat" (exact search over a memory-mapped matrix, see flat_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 
-chroma_client = chromadb.PersistentClient(path="./chroma_db") 
-embed_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+_resources = {}
+_resources_lock = threading.RLock()
 
-vector_collection = chroma_client.get_or_create_collection(
-    name="school_knowledge",
-    embedding_function=embed_fn
-)
+def _shared(key, factory):
+    resource = _resources.get(key)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = factory()
+                _resources[key] = resource
+    return resource
 
-def get_student_info(student_name_query):
+def configure(**resources):
+    """
+    Installs ready-made resources (mongo_db, embed_fn, vector_collection, ...) instead of the
+    defaults, e.g. local stand-ins for benchmarks. Call before the first query.
+    """
+    with _resources_lock:
+        _resources.update(resources)
+
+def get_mongo_db():
+    def create():
+        import pymongo
+        # One pooled client per process; the pool is shared by every thread and session
+        return pymongo.MongoClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE)[MONGO_DB_NAME]
+    return _shared("mongo_db", create)
+
+def get_embed_fn():
+    """Embedding backend chosen by EMBED_BACKEND (see embeddings.py); used for queries and ingestion."""
+    def create():
+        from embeddings import make_embed_fn
+        return make_embed_fn()
+    return _shared("embed_fn", create)
+
+def get_embedding_batcher():
+    """Query-time embeddings go through one shared micro-batcher (see embedding_batcher.py)."""
+    def create():
+        from embedding_batcher import EmbeddingBatcher
+        return EmbeddingBatcher(
+            get_embed_fn(),
+            max_batch_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5")),
+        )
+    return _shared("embedding_batcher", create)
+
+def get_chroma_collection():
+    """The Chroma collection ingest_knowledge.py writes to; the source of truth for the flat index too."""
+    def create():
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+        return chroma_client.get_or_create_collection(
+            name="school_knowledge",
+            embedding_function=get_embed_fn()
+        )
+    return _shared("chroma_collection", create)
+
+def get_vector_collection():
+    """The collection queries run against, chosen by VECTOR_BACKEND. Both expose the same query()."""
+    def create():
+        if VECTOR_BACKEND == "flat":
+            from flat_index import FlatVectorIndex
+            return FlatVectorIndex()
+        if VECTOR_BACKEND != "chroma":
+            raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}'. Choose chroma or flat.")
+        return get_chroma_collection()
+    return _shared("vector_collection", create)
+
+def get_bm25_index():
+    """Lexical index written by ingest_knowledge.py (see bm25_index.py); reloads itself on rebuild."""
+    def create():
+        from bm25_index import BM25Index
+        return BM25Index()
+    return _shared("bm25_index", create)
+
+def get_name_resolver():
+    return _shared("name_resolver", lambda: StudentNameResolver(get_mongo_db().students))
+
+def warmup():
+    """
+    Creates every resource and runs a dummy embedding so the model weights are loaded and the
+    first parent query does not pay for it. Call this once during process start.
+    """
+    get_embedding_batcher().embed("warmup")
+    get_vector_collection()
+    get_bm25_index()
+    get_name_resolver().refresh()
+    get_answer_cache()
+    get_interaction_logger()
+
+def extract_student_name(query):
+    """
+    Returns the most specific student name (full name over first name) mentioned in the query.
+    Names come from the students collection, not a hardcoded list.
+    """
+    with timed("name_extraction"):
+        return get_name_resolver().resolve(query)
+
+# Upper bound on students fetched for a single name; enough to list candidates for disambiguation
+MAX_NAME_CANDIDATES = 10
+
+def student_name_filter(name_norm):
+    """Matches on the indexed full-name or first-name key (students and student_digest alike)."""
+    return {"$or": [{"name_norm": name_norm}, {"first_name_norm": name_norm}]}
+
+def student_context_pipeline(name_norm):
+    """
+    One round trip: match the student by normalized name, join the academic record and the
+    grade curriculum, and return only the fields the prompt uses.
+    """
+    return [
+        {"$match": student_name_filter(name_norm)},
+        {"$limit": MAX_NAME_CANDIDATES},
+        *student_record_stages(),
+    ]
+
+def student_record_stages():
+    """$lookup/$project stages that turn matched student documents into prompt records."""
+    return [
+        {"$lookup": {"from": "academic_records", "localField": "_id", "foreignField": "student_id", "as": "academics"}},
+        {"$lookup": {"from": "curriculum", "localField": "grade", "foreignField": "grade", "as": "curriculum"}},
+        {"$project": {
+            "name": 1,
+            "grade": 1,
+            "section": 1,
+            "logistics": 1,
+            "emergency_contact": "$parent_details.emergency_contact",
+            "academics.attendance_summary.percentage": 1,
+            "academics.grade_card": 1,
+            "academics.pending_assignments": 1,
+            "curriculum.syllabus": 1,
+            "curriculum.timetable": 1,
+        }},
+    ]
+
+def student_digest_pipeline(name_norm):
+    """
+    Matches precomputed digests (see student_digest.py) by normalized name and follows the
+    curriculum pointer for the syllabus and timetable. Still one round trip.
+    """
+    return [
+        {"$match": student_name_filter(name_norm)},
+        {"$limit": MAX_NAME_CANDIDATES},
+        {"$lookup": {"from": "curriculum", "localField": "curriculum.curriculum_id", "foreignField": "_id", "as": "curriculum_doc"}},
+        {"$project": {"curriculum_doc.exam_datesheet": 0, "curriculum_doc.grade": 0, "curriculum_doc.section": 0}},
+    ]
+
+def mongo_deadline(seconds):
+    """
+    Client-side timeout for every Mongo operation in the block (pymongo.timeout, pymongo >= 4.2),
+    so the server abandons a slow lookup instead of it holding a retrieval worker after the
+    caller gave up. A no-op for stand-ins without it (e.g. mongomock) or when seconds is None.
+    """
+    try:
+        import pymongo
+        return pymongo.timeout(seconds)
+    except (ImportError, AttributeError):
+        return contextlib.nullcontext()
+
+def fetch_student_record(student_name_query, timeout=None):
     """
     Structured Retrieval with SAFETY CHECKS.
-    - If 0 matches: Returns None.
-    - If >1 match: Returns a list of candidates (Disambiguation).
-    - If 1 match: Returns the detailed record (Grades + Full Syllabus).
+    - If 0 matches: Returns a SYSTEM_MESSAGE string.
+    - If >1 match: Returns a SYSTEM_MESSAGE listing the candidates (Disambiguation).
+    - If 1 match: Returns the record as a flat dict (profile, grades, attendance, curriculum).
+    With `timeout` (seconds), the Mongo queries raise once it has passed.
     """
     
-    # case-insensitive regex search on the 'name' field
-    query_regex = {"name": {"$regex": student_name_query, "$options": "i"}}
+    # Exact match on the indexed normalized-name fields (full name or first name)
+    name_norm = normalize_name(student_name_query)
     
-    # Fetch ALL matching students to check for duplicates
-    matches = list(mongo_db.students.find(query_regex))
+    # Fetch ALL matching students (with their derived facts) to check for duplicates
+    db = get_mongo_db()
+    with timed("mongo_student_lookup"), mongo_deadline(timeout):
+        # The digest is kept current by student_digest.py (--watch, or --delta on a schedule)
+        matches = list(db.student_digest.aggregate(student_digest_pipeline(name_norm)))
+        from_digest = bool(matches)
+        if not from_digest:
+            # Students added since the last digest refresh are read from the raw collections
+            matches = list(db.students.aggregate(student_context_pipeline(name_norm)))
     
     if len(matches) == 0:
         return "SYSTEM_MESSAGE: No student found with that name. Please verify the spelling."
@@ -36,49 +210,265 @@ def get_student_info(student_name_query):
         candidate_names = [s['name'] for s in matches]
         return f"SYSTEM_MESSAGE: Multiple students found matching '{student_name_query}': {', '.join(candidate_names)}. Please ask the user to specify the full name."
 
-    student = matches[0]
-    s_id = student["_id"]
-    grade = student["grade"]
-    
-    # Fetch Academic Record
-    academics = mongo_db.academic_records.find_one({"student_id": s_id})
-    
-    # Fetch Curriculum (Detailed)
-    curriculum = mongo_db.curriculum.find_one({"grade": grade})
-    
+    if from_digest:
+        digest = matches[0]
+        return digest_to_record(digest, digest["curriculum_doc"][0] if digest["curriculum_doc"] else None)
+    return flatten_student_record(matches[0])
+
+def flatten_student_record(student):
+    """One aggregated student (see student_record_stages) as the flat record dict."""
+    academics = student["academics"][0] if student["academics"] else {}
+    curriculum = student["curriculum"][0] if student["curriculum"] else {}
+    return {
+        "name": student["name"],
+        "grade": student["grade"],
+        "section": student["section"],
+        "emergency_contact": student.get("emergency_contact"),
+        "logistics": student.get("logistics"),
+        "attendance_percentage": academics.get("attendance_summary", {}).get("percentage"),
+        "grade_card": academics.get("grade_card"),
+        "pending_assignments": academics.get("pending_assignments"),
+        "syllabus": curriculum.get("syllabus"),
+        "timetable": curriculum.get("timetable"),
+    }
+
+def get_student_info(student_name_query):
+    """
+    Full student record serialized as JSON (or a SYSTEM_MESSAGE string).
+    The chat path uses context_builder on fetch_student_record() instead, which sends only
+    the sections the question needs.
+    """
+    record = fetch_student_record(student_name_query)
+    if isinstance(record, str):
+        return record
+    return format_student_info(record)
+
+def format_student_info(record, include_curriculum=True):
+    """
+    The record as the JSON document get_student_info returns.
+    include_curriculum=False leaves out the grade-wide syllabus and timetable.
+    """
     info = {
         "Student Profile": {
-            "Name": student["name"],
-            "Grade": student["grade"],
-            "Section": student["section"],
-            "Emergency Contact": student["parent_details"]["emergency_contact"],
-            "Bus Details": student["logistics"]
+            "Name": record["name"],
+            "Grade": record["grade"],
+            "Section": record["section"],
+            "Emergency Contact": record["emergency_contact"],
+            "Bus Details": record["logistics"]
         },
         "Academic Performance": {
-            "Attendance %": academics["attendance_summary"]["percentage"],
-            "Latest Report Card": academics["grade_card"], 
-            "Pending Homework": academics["pending_assignments"]
+            "Attendance %": record["attendance_percentage"],
+            "Latest Report Card": record["grade_card"], 
+            "Pending Homework": record["pending_assignments"]
         },
 
         "Class Syllabus & Timetable": {
-            "Complete Syllabus": curriculum["syllabus"], 
-            "Weekly Timetable": curriculum["timetable"]
+            "Complete Syllabus": record["syllabus"], 
+            "Weekly Timetable": record["timetable"]
         }
     }
+    if not include_curriculum:
+        del info["Class Syllabus & Timetable"]
     return json.dumps(info, indent=2)
 
-def search_general_knowledge(query):
+def search_knowledge_chunks(query, n_results=10, query_embedding=None, where=None):
     """
-    Vector Retrieval: Increased limit to catch more context.
+    Vector Retrieval: returns ranked chunks as dicts with id, text, metadata and distance.
+    Pass `query_embedding` when the query was already embedded (e.g. by the answer cache), and
+    `where` to restrict the search by chunk metadata, e.g. {"category": "transport"} or
+    {"grade": {"$in": [8, 9]}}.
     """
-    results = vector_collection.query(
-        query_texts=[query],
-        n_results=10  # Increased to capture broader context like full subject lists
-    )
+    if query_embedding is None:
+        with timed("query_embedding"):
+            # Batched with other in-flight queries instead of one forward pass per query
+            query_embedding = get_embedding_batcher().embed(query)
+
+    with timed("vector_query"):
+        results = get_vector_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,  # Wide enough to capture broader context like full subject lists
+            where=where,
+        )
     
-    if not results['documents']:
-        return ""
+    if not results['documents'] or not results['documents'][0]:
+        return []
+
+    return [
+        {"id": chunk_id, "text": text, "metadata": metadata or {}, "distance": distance}
+        for chunk_id, text, metadata, distance in zip(
+            results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+        )
+    ]
+
+def search_lexical_chunks(query, n_results=10, where=None):
+    """Lexical Retrieval: BM25 over the same chunks, for exact tokens like "Route_03" or "Late Fee"."""
+    with timed("lexical_query"):
+        return get_bm25_index().search(query, n_results=n_results, where=where)
+
+# Each retriever returns this many candidates; fusion and duplicate removal keep the best
+# KNOWLEDGE_RESULTS for the prompt.
+KNOWLEDGE_CANDIDATES = int(os.getenv("RAG_KNOWLEDGE_CANDIDATES", "20"))
+KNOWLEDGE_RESULTS = int(os.getenv("RAG_KNOWLEDGE_RESULTS", "5"))
 
+def fuse_knowledge_chunks(vector_chunks, lexical_chunks, n_results=KNOWLEDGE_RESULTS):
+    """Reciprocal rank fusion of both result lists, then the best chunks without duplicates."""
+    from bm25_index import reciprocal_rank_fusion, select_distinct
+    with timed("rank_fusion"):
+        fused = reciprocal_rank_fusion({"vector": vector_chunks, "lexical": lexical_chunks})
+        return select_distinct(fused, n_results)
+
+def search_knowledge(query, n_results=KNOWLEDGE_RESULTS, query_embedding=None, where=None):
+    """
+    Hybrid Retrieval: the BM25 query runs on the retrieval pool while the vector query runs
+    here; the merged list is shorter and more precise than either one alone.
+    """
+    lexical = retrieval_executor.submit(contextvars.copy_context().run, search_lexical_chunks, query,
+                                        KNOWLEDGE_CANDIDATES, where)
+    vector_chunks = search_knowledge_chunks(query, KNOWLEDGE_CANDIDATES, query_embedding, where)
+    return fuse_knowledge_chunks(vector_chunks, lexical.result(), n_results)
+
+def search_general_knowledge(query):
+    """
+    Hybrid Retrieval: the fused, de-duplicated chunks as one text block.
+    """
     # Extract just the text
-    retrieved_texts = results['documents'][0]
-    return "\n---\n".join(retrieved_texts)
\ No newline at end of file
+    retrieved_texts = [chunk["text"] for chunk in search_knowledge(query)]
+    return "\n---\n".join(retrieved_texts)
+
+# ==========================================
+# CONCURRENT RETRIEVAL
+# ==========================================
+# Shared, bounded pool: the vector search (CPU-bound embedding + Chroma), the BM25 search and
+# the Mongo lookup (network-bound) overlap instead of adding up.
+RETRIEVAL_WORKERS = int(os.getenv("RAG_RETRIEVAL_WORKERS", "8"))
+KNOWLEDGE_TIMEOUT = float(os.getenv("RAG_KNOWLEDGE_TIMEOUT", "3.0"))
+STUDENT_TIMEOUT = float(os.getenv("RAG_STUDENT_TIMEOUT", "2.0"))
+# Timed-out searches a source may leave running on the pool before new ones are skipped
+MAX_ABANDONED_PER_SOURCE = int(os.getenv("RAG_MAX_ABANDONED_PER_SOURCE", str(max(RETRIEVAL_WORKERS // 4, 1))))
+
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag-retrieval")
+
+# Per source, the timed-out jobs still running. Cancelling a future does not stop a running
+# thread (the in-process vector and BM25 searches cannot be interrupted), so these are counted
+# and capped: a stuck source degrades to "unavailable" instead of filling the whole pool.
+_abandoned = {}
+_abandoned_lock = threading.Lock()
+
+def _abandon(key, future):
+    if future.cancel():
+        return  # Never started, nothing left running
+    with _abandoned_lock:
+        _abandoned[key] = _abandoned.get(key, 0) + 1
+    REGISTRY.inc("edubot_retrieval_abandoned_total", help_text="Retrieval jobs still running after their timeout",
+                 source=key)
+
+    def finished(_):
+        with _abandoned_lock:
+            _abandoned[key] -= 1
+    future.add_done_callback(finished)
+
+def abandoned_count(key):
+    with _abandoned_lock:
+        return _abandoned.get(key, 0)
+
+def retrieve_context(query, student_name=None, knowledge_timeout=KNOWLEDGE_TIMEOUT, student_timeout=STUDENT_TIMEOUT,
+                     query_embedding=None):
+    """
+    Runs the vector search, the BM25 search and the student lookup concurrently.
+    Returns the fused knowledge chunks (see fuse_knowledge_chunks) and the student record
+    (dict or SYSTEM_MESSAGE string). Each source has its own timeout (measured from the call);
+    a slow or failing source is reported in "unavailable" and left empty, so the answer
+    degrades to partial context. The knowledge timeout covers both knowledge searches.
+    The student lookup also carries its timeout to Mongo (see mongo_deadline); a source with
+    MAX_ABANDONED_PER_SOURCE timed-out jobs still running is skipped until they finish.
+    """
+    result = {"knowledge_chunks": [], "lexical_chunks": [], "student_record": None, "unavailable": {}}
+
+    def submit(key, timeout, fn, *args, **kwargs):
+        backlog = abandoned_count(key)
+        if backlog >= MAX_ABANDONED_PER_SOURCE:
+            result["unavailable"][key] = f"skipped, {backlog} earlier searches still running"
+            return
+        # Copy the caller's context so stage timings land in the current request trace
+        jobs[key] = (retrieval_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs), timeout)
+
+    start = time.monotonic()
+    jobs = {}
+    submit("knowledge_chunks", knowledge_timeout, search_knowledge_chunks, query, KNOWLEDGE_CANDIDATES, query_embedding)
+    submit("lexical_chunks", knowledge_timeout, search_lexical_chunks, query, KNOWLEDGE_CANDIDATES)
+    if student_name:
+        submit("student_record", student_timeout, fetch_student_record, student_name, timeout=student_timeout)
+
+    for key, (future, timeout) in jobs.items():
+        remaining = max(0.0, timeout - (time.monotonic() - start))
+        try:
+            result[key] = future.result(timeout=remaining)
+        except FuturesTimeoutError:
+            _abandon(key, future)
+            result["unavailable"][key] = f"timed out after {timeout:.1f}s"
+        except Exception as e:
+            result["unavailable"][key] = str(e)
+    # Either list alone still gives usable context
+    result["knowledge_chunks"] = fuse_knowledge_chunks(result["knowledge_chunks"], result.pop("lexical_chunks"))
+    return result
+
+# ==========================================
+# SEMANTIC ANSWER CACHE
+# ==========================================
+# Collections the knowledge base (and so every cached answer) is built from
+KNOWLEDGE_SOURCES = ("school_info", "curriculum")
+
+def school_info_version():
+    """
+    Fingerprint of the knowledge sources: a hash of every document, in _id order. The collections
+    are small and the answer cache calls this at most every 30s, outside its lock, so hashing the
+    content is cheap and catches in-place edits that no timestamp records.
+    """
+    db = get_mongo_db()
+    digest = hashlib.sha1()
+    with timed("mongo_school_info_version"):
+        for name in KNOWLEDGE_SOURCES:
+            digest.update(name.encode("utf-8"))
+            for doc in db[name].find({}).sort("_id", 1):
+                digest.update(json.dumps(doc, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+def get_answer_cache():
+    """Shared by every session in the process."""
+    def create():
+        from answer_cache import SemanticAnswerCache
+        return SemanticAnswerCache(
+            get_embedding_batcher(),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500")),
+            version_fn=school_info_version,
+        )
+    return _shared("answer_cache", create)
+
+# ==========================================
+# FAST PATH (no LLM)
+# ==========================================
+def get_fast_path_router():
+    def create():
+        from fast_path import FastPathRouter
+        return FastPathRouter(get_mongo_db())
+    return _shared("fast_path_router", create)
+
+def answer_fast_path(query):
+    """Templated answer for an exact factual lookup (see fast_path.py), or None to use RAG + LLM."""
+    with timed("fast_path"):
+        return get_fast_path_router().route(query)
+
+# ==========================================
+# INTERACTION LOG
+# ==========================================
+def get_interaction_logger():
+    """Background writer for the `interactions` collection, fed by every finished request trace."""
+    def create():
+        import metrics
+        from interaction_log import InteractionLogger
+        interaction_logger = InteractionLogger(get_mongo_db().interactions)
+        metrics.add_finish_listener(interaction_logger.on_trace_finished)
+        return interaction_logger
+    return _shared("interaction_logger", create)
@@ -1,18 +1,11 @@
+import argparse
 import pymongo
 import random
+import time
 from datetime import datetime, timedelta
-
-# 1. SETUP CONNECTION
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["school_rag_db"]
-
-# CLEAN SLATE
-db.students.drop()
-db.academic_records.drop()
-db.curriculum.drop()
-db.school_info.drop()
-
-print("Cleaning complete. Generating complex real-world data...")
+from name_resolver import name_fields
+from migrate_db import ensure_indexes
+from student_digest import DigestRefresher
 
 # ==========================================
 # DATA HELPER LISTS (For Realism)
@@ -28,65 +21,75 @@ chapter_pool = {
     "Computer Science": ["Networking Concepts", "HTML and CSS", "Cyber Ethics", "Scratch Programming", "Python Basics", "Conditional Loops", "Lists and Dictionaries", "Database Management", "SQL Commands", "AI Introduction", "Emerging Trends", "Data Visualization"]
 }
 
+names = ["Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
+         "Diya", "Saanvi", "Ananya", "Aadhya", "Pari", "Kiara", "Myra", "Riya", "Anvi", "Fatima",
+         "Rohan", "Kabir", "Dhruv", "Atharv", "Shaurya", "Aryan", "Yash", "Rudra", "Advik", "Mohammed",
+         "Zara", "Navya", "Aarohi", "Ira", "Meera", "Tara", "Sara", "Avni", "Khushi", "Prisha"]
+surnames = ["Sharma", "Verma", "Gupta", "Malhotra", "Iyer", "Khan", "Patel", "Singh", "Das", "Nair",
+            "Reddy", "Joshi", "Mehta", "Chopra", "Kapoor", "Banerjee", "Mukherjee", "Rao", "Pillai", "Menon",
+            "Agarwal", "Jain", "Bose", "Chauhan", "Yadav", "Kulkarni", "Desai", "Shah", "Bhat", "Ansari"]
+
+# Popular names are far more common than rare ones (Zipf-like), so exact full-name collisions
+# appear at realistic rates and exercise the disambiguation path in get_student_info
+name_weights = [1 / (rank + 1) ** 0.5 for rank in range(len(names))]
+surname_weights = [1 / (rank + 1) ** 0.5 for rank in range(len(surnames))]
+
 # ==========================================
 # 2. SCHOOL KNOWLEDGE BASE (Global Info)
 # ==========================================
+def build_school_info():
+    # A. COMPLEX BUS ROUTES
+    bus_routes = []
+    areas = ["Green Valley", "Highland Park", "Sector 15", "Civil Lines", "Model Town", "Railway Colony", "Airport Road", "Tech Park", "River View", "Old City"]
+    for i in range(1, 11):
+        route_id = f"Route_{i:02d}"
+        area = areas[i-1]
+        stops = [f"{area} Main Gate", f"{area} Market", f"{area} Phase 1", f"{area} Phase 2", "School Drop Point"]
+        bus_routes.append({
+            "route_id": route_id,
+            "driver_name": random.choice(["Ramesh Singh", "Suresh Yadav", "Dalip Kumar", "Rajesh Gill"]),
+            "driver_contact": f"98765432{i:02d}",
+            "stops": stops,
+            "timings": {"pickup_start": "06:45 AM", "school_reach": "07:50 AM", "drop_start": "02:10 PM"}
+        })
 
-# A. COMPLEX BUS ROUTES
-bus_routes = []
-areas = ["Green Valley", "Highland Park", "Sector 15", "Civil Lines", "Model Town", "Railway Colony", "Airport Road", "Tech Park", "River View", "Old City"]
-for i in range(1, 11):
-    route_id = f"Route_{i:02d}"
-    area = areas[i-1]
-    stops = [f"{area} Main Gate", f"{area} Market", f"{area} Phase 1", f"{area} Phase 2", "School Drop Point"]
-    bus_routes.append({
-        "route_id": route_id,
-        "driver_name": random.choice(["Ramesh Singh", "Suresh Yadav", "Dalip Kumar", "Rajesh Gill"]),
-        "driver_contact": f"98765432{i:02d}",
-        "stops": stops,
-        "timings": {"pickup_start": "06:45 AM", "school_reach": "07:50 AM", "drop_start": "02:10 PM"}
-    })
-
-# B. DETAILED POLICIES
-policies = [
-    {
-        "category": "policies", "title": "Fee Structure 2024-25",
-        "content": "Admission Fee: $500 (One time). Annual Charges: $300. Tuition Fee (Monthly): Grade 1-5: $150, Grade 6-10: $200. Lab Charges: $50/month (Gr 9-10). Transport Fee: varies by route ($80-$120). Late Fee: $10 per day after the 10th of the month."
-    },
-    {
-        "category": "policies", "title": "Uniform Code",
-        "content": "Summer (Mon/Tue/Thu/Fri): White shirt with school logo, Grey trousers/skirt, Black shoes, Grey socks. Winter: Navy Blue Blazer mandatory. Sports (Wed/Sat): House colored T-shirt, White track pants, White canvas shoes."
-    },
-    {
-        "category": "policies", "title": "Assessment & Promotion",
-        "content": "Student must secure 40% in aggregate and 35% in each subject to pass. Attendance requirement is 75% minimum. Medical certificates must be submitted within 3 days of leave."
-    }
-]
+    # B. DETAILED POLICIES
+    policies = [
+        {
+            "category": "policies", "title": "Fee Structure 2024-25",
+            "content": "Admission Fee: $500 (One time). Annual Charges: $300. Tuition Fee (Monthly): Grade 1-5: $150, Grade 6-10: $200. Lab Charges: $50/month (Gr 9-10). Transport Fee: varies by route ($80-$120). Late Fee: $10 per day after the 10th of the month."
+        },
+        {
+            "category": "policies", "title": "Uniform Code",
+            "content": "Summer (Mon/Tue/Thu/Fri): White shirt with school logo, Grey trousers/skirt, Black shoes, Grey socks. Winter: Navy Blue Blazer mandatory. Sports (Wed/Sat): House colored T-shirt, White track pants, White canvas shoes."
+        },
+        {
+            "category": "policies", "title": "Assessment & Promotion",
+            "content": "Student must secure 40% in aggregate and 35% in each subject to pass. Attendance requirement is 75% minimum. Medical certificates must be submitted within 3 days of leave."
+        }
+    ]
 
-# C. RICH CALENDAR
-calendar_events = []
-# Holidays
-holidays = {"2024-08-15": "Independence Day", "2024-10-02": "Gandhi Jayanti", "2024-11-01": "Diwali Break Start", "2024-11-05": "Diwali Break End", "2024-12-25": "Christmas"}
-for date, event in holidays.items():
-    calendar_events.append({"date": date, "event": event, "type": "Holiday", "school_closed": True})
+    # C. RICH CALENDAR
+    calendar_events = []
+    # Holidays
+    holidays = {"2024-08-15": "Independence Day", "2024-10-02": "Gandhi Jayanti", "2024-11-01": "Diwali Break Start", "2024-11-05": "Diwali Break End", "2024-12-25": "Christmas"}
+    for date, event in holidays.items():
+        calendar_events.append({"date": date, "event": event, "type": "Holiday", "school_closed": True})
 
-# Exams
-calendar_events.append({"start_date": "2024-09-15", "end_date": "2024-09-25", "event": "Half-Yearly Examinations", "type": "Exam"})
-calendar_events.append({"start_date": "2025-03-01", "end_date": "2025-03-15", "event": "Final Examinations", "type": "Exam"})
+    # Exams
+    calendar_events.append({"start_date": "2024-09-15", "end_date": "2024-09-25", "event": "Half-Yearly Examinations", "type": "Exam"})
+    calendar_events.append({"start_date": "2025-03-01", "end_date": "2025-03-15", "event": "Final Examinations", "type": "Exam"})
 
-# Events
-calendar_events.append({"date": "2024-11-14", "event": "Children's Day Fete", "type": "Celebration", "school_closed": False})
-calendar_events.append({"date": "2024-12-10", "event": "Annual Sports Day", "type": "Sports", "school_closed": False})
+    # Events
+    calendar_events.append({"date": "2024-11-14", "event": "Children's Day Fete", "type": "Celebration", "school_closed": False})
+    calendar_events.append({"date": "2024-12-10", "event": "Annual Sports Day", "type": "Sports", "school_closed": False})
 
-# Insert Global Data
-db.school_info.insert_many([{"category": "transport", "routes": bus_routes}] + policies + [{"category": "calendar", "events": calendar_events}])
+    return [{"category": "transport", "routes": bus_routes}] + policies + [{"category": "calendar", "events": calendar_events}]
 
 # ==========================================
 # 3. CURRICULUM & TIMETABLES (Per Grade)
 # ==========================================
-grades_data = []
-
-for g in range(6, 11): # Grades 6 to 10
+def build_curriculum(g):
     # Generate Timetable
     timetable = {}
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
@@ -107,107 +110,192 @@ for g in range(6, 11): # Grades 6 to 10
         selected_chaps = random.sample(chapter_pool[sub], min(num_chapters, len(chapter_pool[sub])))
         grade_syllabus[sub] = [f"Ch {idx+1}: {name}" for idx, name in enumerate(selected_chaps)]
 
-    db.curriculum.insert_one({
+    return {
         "grade": g,
         "section": "General", # Applying to all sections for now
+        "updated_at": datetime.utcnow(),
         "syllabus": grade_syllabus,
         "timetable": timetable,
         "exam_datesheet": {
              "Half-Yearly": {sub: f"2024-09-{random.randint(15,25)}" for sub in subjects_list}
         }
-    })
+    }
 
 # ==========================================
 # 4. STUDENTS & ACADEMIC RECORDS (Dynamic)
 # ==========================================
-names = ["Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
-         "Diya", "Saanvi", "Ananya", "Aadhya", "Pari", "Kiara", "Myra", "Riya", "Anvi", "Fatima"]
-surnames = ["Sharma", "Verma", "Gupta", "Malhotra", "Iyer", "Khan", "Patel", "Singh", "Das", "Nair"]
-
-student_docs = []
-academic_docs = []
-
-# Distribute 20 students across grades 6-10 (4 students per grade)
-student_counter = 0
-for grade in range(6, 11):
-    for _ in range(4): # 4 students per grade
-        student_counter += 1
-        s_id = f"STU_{student_counter:03d}"
-        fname = names[student_counter-1]
-        lname = random.choice(surnames)
-        
-        # 1. Student Personal Doc
-        stu_doc = {
-            "_id": s_id,
-            "name": f"{fname} {lname}",
-            "grade": grade,
-            "section": random.choice(["A", "B", "C"]),
-            "roll_no": random.randint(1, 40),
-            "dob": "2010-05-20",
-            "parent_details": {
-                "father_name": f"Mr. {lname}",
-                "mother_name": f"Mrs. {lname}",
-                "primary_email": f"parent.{fname.lower()}@example.com",
-                "emergency_contact": f"98765{random.randint(10000, 99999)}"
-            },
-            "logistics": {
-                "mode": "School Bus",
-                "route_id": f"Route_{random.randint(1,10):02d}", # Link to complex routes
-                "stop_name": "Market Stop"
-            }
-        }
-        student_docs.append(stu_doc)
-
-        # 2. Academic Record Doc
-        # Generate Monthly Attendance
-        months = ["June", "July", "August", "September", "October"]
-        attendance_log = {}
-        total_present = 0
-        total_working = 0
-        
-        for m in months:
-            working_days = 24
-            present = random.randint(18, 24)
-            attendance_log[m] = {"working_days": working_days, "present": present}
-            total_present += present
-            total_working += working_days
-
-        # Generate Grades for all 6 subjects
-        grade_card = []
-        for sub in subjects_list:
-            grade_card.append({
-                "subject": sub,
-                "unit_test_1": random.randint(15, 25), # Out of 25
-                "half_yearly": random.randint(60, 100), # Out of 100
-                "project_score": random.randint(15, 20), # Out of 20
-                "remarks": random.choice(["Participates well", "Needs to submit homework on time", "Excellent concept clarity", "Distracted in class"])
-            })
-
-        acad_doc = {
-            "student_id": s_id,
-            "academic_year": "2024-25",
-            "class_teacher": "Mrs. Anderson",
-            "attendance_summary": {
-                "total_working_days": total_working,
-                "total_present": total_present,
-                "percentage": round((total_present/total_working)*100, 1),
-                "monthly_breakdown": attendance_log
-            },
-            "grade_card": grade_card,
-            "pending_assignments": [
-                {"subject": "Science", "title": "Model of Atom", "due_date": "2024-11-20", "status": "Pending"},
-                {"subject": "English", "title": "Essay on Pollution", "due_date": "2024-11-18", "status": "Pending"}
-            ]
+def build_student(s_id, fname, lname, grade, section=None, school_id=None):
+    student = {
+        "_id": s_id,
+        "name": f"{fname} {lname}",
+        **name_fields(f"{fname} {lname}"),
+        "grade": grade,
+        "section": section or random.choice(["A", "B", "C"]),
+        "updated_at": datetime.utcnow(),
+        "roll_no": random.randint(1, 40),
+        "dob": "2010-05-20",
+        "parent_details": {
+            "father_name": f"Mr. {lname}",
+            "mother_name": f"Mrs. {lname}",
+            "primary_email": f"parent.{fname.lower()}@example.com",
+            "emergency_contact": f"98765{random.randint(10000, 99999)}"
+        },
+        "logistics": {
+            "mode": "School Bus",
+            "route_id": f"Route_{random.randint(1,10):02d}", # Link to complex routes
+            "stop_name": "Market Stop"
         }
-        academic_docs.append(acad_doc)
-
-db.students.insert_many(student_docs)
-db.academic_records.insert_many(academic_docs)
-
-print("----------------------------------------------------------------")
-print(f"DATABASE GENERATION SUCCESSFUL")
-print(f"1. Students: {len(student_docs)} records (Grades 6-10)")
-print(f"2. Academic Records: {len(academic_docs)} records (With monthly attendance & 6 subjects)")
-print(f"3. Curriculum: 5 documents (One per grade, with Timetables & Syllabus)")
-print(f"4. School Info: Bus Routes (10), Policies (Fees, Uniform, etc), Calendar (Exams, Events)")
-print("----------------------------------------------------------------")
\ No newline at end of file
+    }
+    if school_id:
+        student["school_id"] = school_id
+    return student
+
+def build_academic_record(s_id):
+    # Generate Monthly Attendance
+    months = ["June", "July", "August", "September", "October"]
+    attendance_log = {}
+    total_present = 0
+    total_working = 0
+    
+    for m in months:
+        working_days = 24
+        present = random.randint(18, 24)
+        attendance_log[m] = {"working_days": working_days, "present": present}
+        total_present += present
+        total_working += working_days
+
+    # Generate Grades for all 6 subjects
+    grade_card = []
+    for sub in subjects_list:
+        grade_card.append({
+            "subject": sub,
+            "unit_test_1": random.randint(15, 25), # Out of 25
+            "half_yearly": random.randint(60, 100), # Out of 100
+            "project_score": random.randint(15, 20), # Out of 20
+            "remarks": random.choice(["Participates well", "Needs to submit homework on time", "Excellent concept clarity", "Distracted in class"])
+        })
+
+    return {
+        "student_id": s_id,
+        "academic_year": "2024-25",
+        "updated_at": datetime.utcnow(),
+        "class_teacher": "Mrs. Anderson",
+        "attendance_summary": {
+            "total_working_days": total_working,
+            "total_present": total_present,
+            "percentage": round((total_present/total_working)*100, 1),
+            "monthly_breakdown": attendance_log
+        },
+        "grade_card": grade_card,
+        "pending_assignments": [
+            {"subject": "Science", "title": "Model of Atom", "due_date": "2024-11-20", "status": "Pending"},
+            {"subject": "English", "title": "Essay on Pollution", "due_date": "2024-11-18", "status": "Pending"}
+        ]
+    }
+
+
+# ==========================================
+# 5. STREAMED BULK GENERATION
+# ==========================================
+def iter_students(num_students, schools=1, grades=range(6, 11), sections=("A", "B", "C")):
+    """
+    Yields (student, academic_record) pairs one at a time, spread round-robin over every
+    school x grade x section class, so memory stays flat however many students are requested.
+    """
+    classes = [(school, grade, section) for school in range(1, schools + 1) for grade in grades for section in sections]
+    width = max(3, len(str(num_students)))
+    # A demo-sized seed gets distinct first names, so first-name questions resolve to one student;
+    # larger ones draw Zipf-weighted names, collisions included
+    first_names = random.sample(names, num_students) if num_students <= len(names) else None
+    for counter in range(1, num_students + 1):
+        school, grade, section = classes[(counter - 1) % len(classes)]
+        s_id = f"STU_{counter:0{width}d}"
+        fname = first_names[counter - 1] if first_names else random.choices(names, weights=name_weights)[0]
+        lname = random.choices(surnames, weights=surname_weights)[0]
+        school_id = f"SCH_{school:03d}" if schools > 1 else None
+        yield build_student(s_id, fname, lname, grade, section, school_id), build_academic_record(s_id)
+
+
+def insert_students(db, num_students, chunk_size=5000, show_progress=True, **layout):
+    """Streams iter_students() into Mongo as unordered insert_many chunks. Returns the count inserted."""
+    start = time.monotonic()
+    inserted = 0
+    students, records = [], []
+
+    def flush():
+        nonlocal inserted, students, records
+        db.students.insert_many(students, ordered=False)
+        db.academic_records.insert_many(records, ordered=False)
+        inserted += len(students)
+        students, records = [], []
+        if show_progress:
+            rate = inserted / max(time.monotonic() - start, 1e-9)
+            print(f"\r   {inserted:,}/{num_students:,} students ({rate:,.0f} students/s)", end="", flush=True)
+
+    for student, record in iter_students(num_students, **layout):
+        students.append(student)
+        records.append(record)
+        if len(students) >= chunk_size:
+            flush()
+    if students:
+        flush()
+    if show_progress:
+        print()
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates the demo school database (or a much larger one for load tests).")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="school_rag_db")
+    parser.add_argument("--schools", type=int, default=1)
+    parser.add_argument("--grades", default="6-10", help="Grade range, e.g. 1-12, or a single grade")
+    parser.add_argument("--sections", type=int, default=3, help="Sections per grade (A, B, C, ...)")
+    parser.add_argument("--students", type=int, default=20, help="Total students across all schools")
+    parser.add_argument("--seed", type=int, default=42, help="Same seed, same data")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Documents per insert_many")
+    args = parser.parse_args()
+
+    first_grade, _, last_grade = args.grades.partition("-")
+    grades = range(int(first_grade), int(last_grade or first_grade) + 1)
+    sections = tuple(chr(ord("A") + i) for i in range(args.sections))
+    random.seed(args.seed)
+
+    # 1. SETUP CONNECTION
+    client = pymongo.MongoClient(args.uri)
+    db = client[args.db]
+
+    # CLEAN SLATE
+    db.students.drop()
+    db.academic_records.drop()
+    db.curriculum.drop()
+    db.school_info.drop()
+    db.student_digest.drop()
+    db.digest_state.drop()
+
+    print("Cleaning complete. Generating complex real-world data...")
+
+    # Insert Global Data (every school follows the same board curriculum and timetable per grade)
+    db.school_info.insert_many(build_school_info())
+    db.curriculum.insert_many([build_curriculum(g) for g in grades])
+
+    start = time.monotonic()
+    inserted = insert_students(db, args.students, chunk_size=args.chunk_size,
+                               schools=args.schools, grades=grades, sections=sections)
+    # Indexes are built once after the bulk load instead of being maintained on every insert
+    ensure_indexes(db)
+    digested = DigestRefresher(db).rebuild()
+    elapsed = time.monotonic() - start
+
+    print("----------------------------------------------------------------")
+    print(f"DATABASE GENERATION SUCCESSFUL ({elapsed:.1f}s, seed {args.seed})")
+    print(f"1. Students: {inserted:,} records ({args.schools} school(s), Grades {args.grades}, {len(sections)} sections)")
+    print(f"2. Academic Records: {inserted:,} records (With monthly attendance & 6 subjects)")
+    print(f"3. Curriculum: {len(grades)} documents (One per grade, with Timetables & Syllabus)")
+    print(f"4. School Info: Bus Routes (10), Policies (Fees, Uniform, etc), Calendar (Exams, Events)")
+    print(f"5. Student Digests: {digested:,} documents (derived pass/fail, attendance, overdue homework)")
+    print("----------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
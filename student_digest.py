@@ -0,0 +1,304 @@
+"""
+Materialized per-student digests in the `student_digest` collection.
+
+Usage:
+    python student_digest.py --rebuild     # digest every student, drop digests of removed students
+    python student_digest.py --delta       # refresh students whose sources changed since the last run
+    python student_digest.py --watch       # follow change streams (needs a replica set)
+
+A digest holds the facts the chat path needs, already derived: per-subject percentages and
+pass/fail against the promotion rule, the aggregate, attendance against the 75% requirement,
+overdue assignments and a pointer to the grade curriculum. rag_engine.fetch_student_record
+reads it with one indexed lookup instead of joining and re-deriving the raw records.
+"""
+import argparse
+import math
+import time
+from datetime import date, datetime, timezone
+
+# "Assessment & Promotion" policy
+SUBJECT_PASS_PERCENT = 35
+AGGREGATE_PASS_PERCENT = 40
+ATTENDANCE_REQUIRED_PERCENT = 75
+
+MAX_MARKS = {"unit_test_1": 25, "half_yearly": 100, "project_score": 20}
+SOURCE_COLLECTIONS = ("students", "academic_records", "curriculum")
+
+
+# ==========================================
+# 1. DERIVATION
+# ==========================================
+def _subject_summary(row):
+    obtained = sum(row.get(field) or 0 for field in MAX_MARKS)
+    percentage = round(obtained / sum(MAX_MARKS.values()) * 100, 1)
+    return {
+        "subject": row["subject"],
+        **{field: row.get(field) for field in MAX_MARKS},
+        "remarks": row.get("remarks"),
+        "percentage": percentage,
+        "passed": percentage >= SUBJECT_PASS_PERCENT,
+    }
+
+
+def _attendance_summary(summary):
+    working = summary.get("total_working_days") or 0
+    present = summary.get("total_present") or 0
+    percentage = summary.get("percentage")
+    if percentage is None and working:
+        percentage = round(present / working * 100, 1)
+    required_days = math.ceil(working * ATTENDANCE_REQUIRED_PERCENT / 100)
+    return {
+        "percentage": percentage,
+        "required_percentage": ATTENDANCE_REQUIRED_PERCENT,
+        "meets_requirement": percentage is not None and percentage >= ATTENDANCE_REQUIRED_PERCENT,
+        "days_short": max(0, required_days - present) if working else 0,
+    }
+
+
+def build_digest(student, academics, curriculum_id=None, today=None):
+    """
+    Digest document for one student. `academics` is the academic_records document (or None);
+    `today` (YYYY-MM-DD) decides which pending assignments are overdue.
+    """
+    today = today or date.today().isoformat()
+    academics = academics or {}
+    subjects = [_subject_summary(row) for row in academics.get("grade_card") or []]
+    aggregate = round(sum(s["percentage"] for s in subjects) / len(subjects), 1) if subjects else None
+    pending = [a for a in academics.get("pending_assignments") or [] if a.get("status", "Pending") == "Pending"]
+    overdue = [a for a in pending if a.get("due_date") and a["due_date"] < today]
+    upcoming_due = sorted(a["due_date"] for a in pending if a.get("due_date") and a["due_date"] >= today)
+    ranked = sorted(subjects, key=lambda s: s["percentage"])
+
+    digest = {
+        "_id": student["_id"],
+        "name": student.get("name"),
+        "name_norm": student.get("name_norm"),
+        "first_name_norm": student.get("first_name_norm"),
+        "grade": student.get("grade"),
+        "section": student.get("section"),
+        "emergency_contact": (student.get("parent_details") or {}).get("emergency_contact"),
+        "logistics": student.get("logistics"),
+        "academic_record_id": academics.get("_id"),
+        "class_teacher": academics.get("class_teacher"),
+        "attendance": _attendance_summary(academics.get("attendance_summary") or {}),
+        "subjects": subjects,
+        "aggregate_percentage": aggregate,
+        "failed_subjects": [s["subject"] for s in subjects if not s["passed"]],
+        "passed": bool(subjects) and aggregate >= AGGREGATE_PASS_PERCENT and all(s["passed"] for s in subjects),
+        "strongest_subject": ranked[-1]["subject"] if ranked else None,
+        "weakest_subject": ranked[0]["subject"] if ranked else None,
+        "pending_assignments": pending,
+        "overdue_assignments": overdue,
+        # When the next pending assignment turns overdue; the delta job re-digests from that day
+        "next_due_date": upcoming_due[0] if upcoming_due else None,
+        "curriculum": {"grade": student.get("grade"), "curriculum_id": curriculum_id},
+        "digested_on": today,
+        "refreshed_at": datetime.now(timezone.utc),
+    }
+    if student.get("school_id"):
+        digest["school_id"] = student["school_id"]
+    return digest
+
+
+def digest_to_record(digest, curriculum=None):
+    """The flat record shape rag_engine.fetch_student_record returns, with the derived facts."""
+    curriculum = curriculum or {}
+    attendance = digest.get("attendance") or {}
+    return {
+        "name": digest["name"],
+        "grade": digest["grade"],
+        "section": digest["section"],
+        "emergency_contact": digest.get("emergency_contact"),
+        "logistics": digest.get("logistics"),
+        "attendance_percentage": attendance.get("percentage"),
+        "attendance": attendance,
+        "grade_card": digest.get("subjects"),
+        "aggregate_percentage": digest.get("aggregate_percentage"),
+        "passed": digest.get("passed"),
+        "failed_subjects": digest.get("failed_subjects"),
+        "pending_assignments": digest.get("pending_assignments"),
+        "overdue_assignments": digest.get("overdue_assignments"),
+        "syllabus": curriculum.get("syllabus"),
+        "timetable": curriculum.get("timetable"),
+    }
+
+
+# ==========================================
+# 2. REFRESH
+# ==========================================
+def _source_pipeline(match):
+    return [
+        {"$match": match},
+        {"$lookup": {"from": "academic_records", "localField": "_id", "foreignField": "student_id", "as": "academics"}},
+        {"$lookup": {"from": "curriculum", "localField": "grade", "foreignField": "grade", "as": "curriculum"}},
+        # Only the curriculum pointer is kept, not the syllabus and timetable
+        {"$addFields": {"curriculum": {"$map": {"input": "$curriculum", "in": "$$this._id"}}}},
+    ]
+
+
+class DigestRefresher:
+    def __init__(self, db, batch_size=1000):
+        self.db = db
+        self.batch_size = batch_size
+
+    def _write(self, digests):
+        from pymongo import ReplaceOne
+
+        if digests:
+            self.db.student_digest.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in digests],
+                                              ordered=False)
+
+    def _digest_matching(self, match):
+        today = date.today().isoformat()
+        batch, count = [], 0
+        for student in self.db.students.aggregate(_source_pipeline(match), allowDiskUse=True):
+            academics = student["academics"][0] if student["academics"] else None
+            curriculum_id = student["curriculum"][0] if student["curriculum"] else None
+            batch.append(build_digest(student, academics, curriculum_id, today))
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                count += len(batch)
+                batch = []
+        self._write(batch)
+        return count + len(batch)
+
+    def refresh_students(self, student_ids):
+        """Re-digests the given students; ids that no longer exist lose their digest."""
+        student_ids = list(set(student_ids))
+        refreshed = 0
+        for i in range(0, len(student_ids), self.batch_size):
+            chunk = student_ids[i:i + self.batch_size]
+            refreshed += self._digest_matching({"_id": {"$in": chunk}})
+            existing = {s["_id"] for s in self.db.students.find({"_id": {"$in": chunk}}, {"_id": 1})}
+            removed = [s_id for s_id in chunk if s_id not in existing]
+            if removed:
+                self.db.student_digest.delete_many({"_id": {"$in": removed}})
+        return refreshed
+
+    def refresh_grades(self, grades):
+        return self._digest_matching({"grade": {"$in": list(set(grades))}})
+
+    def rebuild(self):
+        started = datetime.now(timezone.utc)
+        count = self._digest_matching({})
+        # Anything not rewritten by this pass belongs to a student that no longer exists
+        self.db.student_digest.delete_many({"refreshed_at": {"$lt": started}})
+        self._save_state(last_delta=started)
+        return count
+
+    # --- Delta job (keyed on updated_at) ---
+    def _load_state(self):
+        return self.db.digest_state.find_one({"_id": "student_digest"}) or {}
+
+    def _save_state(self, **fields):
+        self.db.digest_state.update_one({"_id": "student_digest"}, {"$set": fields}, upsert=True)
+
+    def refresh_delta(self):
+        """
+        Refreshes students whose students/academic_records documents changed since the last run,
+        whole grades whose curriculum changed, and digests whose pending assignments turned
+        overdue. The first run (no checkpoint yet) rebuilds everything.
+        """
+        state = self._load_state()
+        since = state.get("last_delta")
+        if since is None:
+            return {"rebuilt": self.rebuild()}
+
+        # Take the checkpoint before reading, so writes that land during the run are seen next time
+        started = datetime.now(timezone.utc)
+        changed = {"$gt": since}
+        student_ids = [s["_id"] for s in self.db.students.find({"updated_at": changed}, {"_id": 1})]
+        student_ids += [r["student_id"] for r in self.db.academic_records.find({"updated_at": changed}, {"student_id": 1})]
+        student_ids += [d["_id"] for d in self.db.student_digest.find(
+            {"next_due_date": {"$lt": date.today().isoformat()}}, {"_id": 1})]
+        grades = [c["grade"] for c in self.db.curriculum.find({"updated_at": changed}, {"grade": 1})]
+
+        stats = {"students": self.refresh_students(student_ids), "grade_students": self.refresh_grades(grades)}
+        self._save_state(last_delta=started)
+        return stats
+
+    # --- Change streams ---
+    def watch(self, max_batch=500, max_wait=1.0):
+        """
+        Follows inserts/updates/deletes on the source collections and refreshes the affected
+        digests in small batches. The resume token is saved, so a restart continues where it stopped.
+        Dropping or renaming a source collection (e.g. re-running seed_databse.py) schedules a
+        full rebuild(); an invalidate also discards the resume token and reopens the stream.
+        """
+        pipeline = [{"$match": {"$or": [{"ns.coll": {"$in": list(SOURCE_COLLECTIONS)}},
+                                        {"operationType": "dropDatabase"}]}}]
+        resume_token = self._load_state().get("resume_token")
+        while True:
+            with self.db.watch(pipeline, resume_after=resume_token) as stream:
+                resume_token = self._follow(stream, max_batch, max_wait)
+
+    def _follow(self, stream, max_batch, max_wait):
+        """Consumes one stream until it closes; returns the token to resume from (None after an invalidate)."""
+        student_ids, grades = set(), set()
+        rebuild = invalidated = False
+        last_flush = time.monotonic()
+        while stream.alive and not invalidated:
+            change = stream.try_next()
+            if change is not None:
+                invalidated = change["operationType"] == "invalidate"
+                rebuild = self._collect_change(change, student_ids, grades) or rebuild
+            pending = len(student_ids) + len(grades) + rebuild
+            if invalidated or (pending and (pending >= max_batch or time.monotonic() - last_flush >= max_wait)):
+                if rebuild:
+                    # Covers the collected students and grades too
+                    self.rebuild()
+                else:
+                    self.refresh_students(student_ids)
+                    self.refresh_grades(grades)
+                self._save_state(resume_token=None if invalidated else stream.resume_token)
+                student_ids, grades, rebuild = set(), set(), False
+                last_flush = time.monotonic()
+        return None if invalidated else stream.resume_token
+
+    def _collect_change(self, change, student_ids, grades):
+        """Adds the students and grades a change affects. Returns True if only a full rebuild covers it."""
+        op = change["operationType"]
+        if op in ("drop", "rename", "dropDatabase", "invalidate"):
+            # No documentKey (and for dropDatabase/invalidate no ns.coll) on these
+            return True
+        if op not in ("insert", "update", "replace", "delete"):
+            return False
+        collection = change["ns"]["coll"]
+        key = change["documentKey"]["_id"]
+        if collection == "students":
+            student_ids.add(key)
+        elif collection == "academic_records":
+            doc = change.get("fullDocument") or self.db.academic_records.find_one({"_id": key}, {"student_id": 1})
+            if doc:
+                student_ids.add(doc["student_id"])
+            else:
+                # Deleted record: find the student through the digest that pointed at it
+                student_ids.update(self.db.student_digest.distinct("_id", {"academic_record_id": key}))
+        elif collection == "curriculum":
+            doc = change.get("fullDocument") or self.db.curriculum.find_one({"_id": key}, {"grade": 1})
+            if doc:
+                grades.add(doc["grade"])
+            else:
+                found = self.db.student_digest.distinct("curriculum.grade", {"curriculum.curriculum_id": key})
+                grades.update(found)
+        return False
+
+if __name__ == "__main__":
+    import rag_engine as rag
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rebuild", action="store_true")
+    mode.add_argument("--delta", action="store_true")
+    mode.add_argument("--watch", action="store_true")
+    args = parser.parse_args()
+
+    refresher = DigestRefresher(rag.get_mongo_db())
+    start = time.monotonic()
+    if args.rebuild:
+        print(f"Digested {refresher.rebuild()} students in {time.monotonic() - start:.1f}s")
+    elif args.delta:
+        print(f"Delta refresh: {refresher.refresh_delta()} in {time.monotonic() - start:.1f}s")
+    else:
+        print("Watching students, academic_records and curriculum for changes (Ctrl+C to stop)...")
+        refresher.watch()
@@ -0,0 +1,250 @@
+"""
+Bounded chat transcripts for the Streamlit app.
+
+Each session keeps only its most recent messages in st.session_state (SessionTranscript);
+older ones are spilled to a store and read back page by page when the parent asks for them.
+Two caps bound memory:
+
+    TRANSCRIPT_WINDOW            messages kept in memory per session (spills in batches down to half)
+    TRANSCRIPT_SESSION_MAX_KB    bytes of message text kept in memory per session
+    TRANSCRIPT_GLOBAL_MAX_MB     bytes across all sessions in the process; when exceeded, the least
+                                 recently active sessions are spilled down to their last messages
+
+Stores (TRANSCRIPT_STORE): "disk" appends JSON lines to one file per session under
+TRANSCRIPT_DIR; "mongo" writes to the `session_transcripts` collection. Both expire transcripts
+after TRANSCRIPT_TTL_HOURS of inactivity. Messages hold only the TTS audio key; the bytes stay in
+the audio cache (tts.py) and are loaded when a message is played.
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+
+from metrics import REGISTRY
+
+TRANSCRIPT_STORE = os.getenv("TRANSCRIPT_STORE", "disk")
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", "./transcripts")
+TRANSCRIPT_WINDOW = int(os.getenv("TRANSCRIPT_WINDOW", "20"))
+TRANSCRIPT_SESSION_MAX_KB = float(os.getenv("TRANSCRIPT_SESSION_MAX_KB", "256"))
+TRANSCRIPT_GLOBAL_MAX_MB = float(os.getenv("TRANSCRIPT_GLOBAL_MAX_MB", "64"))
+TRANSCRIPT_TTL_HOURS = float(os.getenv("TRANSCRIPT_TTL_HOURS", "24"))
+
+# Rough per-message overhead of the dict and its keys, on top of the text itself
+MESSAGE_OVERHEAD_BYTES = 300
+# Messages a session keeps when the global cap forces it to spill
+MIN_WINDOW = 2
+
+
+def message_size(message):
+    return len(message["content"].encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+# ==========================================
+# 1. STORES
+# ==========================================
+class DiskTranscriptStore:
+    """
+    One JSON-lines file per session; files untouched for `ttl_seconds` are deleted, on start
+    and then at most every `purge_interval` seconds from append().
+    """
+
+    def __init__(self, directory=TRANSCRIPT_DIR, ttl_seconds=TRANSCRIPT_TTL_HOURS * 3600, purge_interval=3600):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._purged_at = 0.0
+        self.purge()
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def append(self, session_id, messages):
+        lines = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages)
+        with self._lock:
+            with open(self._path(session_id), "a", encoding="utf-8") as f:
+                f.write(lines)
+            purge_due = time.monotonic() - self._purged_at >= self.purge_interval
+            if purge_due:
+                # Claimed here so concurrent appends do not all scan the directory
+                self._purged_at = time.monotonic()
+        if purge_due:
+            self.purge()
+
+    def load(self, session_id, before_seq, limit):
+        """Up to `limit` messages with seq < before_seq, oldest first."""
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                messages = [m for m in map(json.loads, f) if m["seq"] < before_seq]
+        except FileNotFoundError:
+            return []
+        return messages[-limit:]
+
+    def purge(self):
+        self._purged_at = time.monotonic()
+        cutoff = time.time() - self.ttl_seconds
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+class MongoTranscriptStore:
+    """
+    The `session_transcripts` collection, one document per message. migrate_db.ensure_indexes
+    creates the (session_id, seq) index and the TTL index on `ts` that expires old transcripts.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def append(self, session_id, messages):
+        now = datetime.now(timezone.utc)
+        self.collection.insert_many([{**m, "session_id": session_id, "ts": now} for m in messages], ordered=False)
+
+    def load(self, session_id, before_seq, limit):
+        cursor = (self.collection.find({"session_id": session_id, "seq": {"$lt": before_seq}},
+                                       {"_id": 0, "session_id": 0, "ts": 0})
+                  .sort("seq", -1).limit(limit))
+        return list(reversed(list(cursor)))
+
+    def purge(self):
+        pass  # The TTL index does it
+
+
+def make_store(kind=TRANSCRIPT_STORE):
+    if kind == "disk":
+        return DiskTranscriptStore()
+    if kind == "mongo":
+        import rag_engine as rag
+        return MongoTranscriptStore(rag.get_mongo_db().session_transcripts)
+    raise ValueError(f"Unknown TRANSCRIPT_STORE '{kind}'. Choose disk or mongo.")
+
+
+# ==========================================
+# 2. PER-SESSION WINDOW
+# ==========================================
+class SessionTranscript:
+    """
+    The recent messages of one session. Messages are dicts with seq, role, content and
+    (assistant only) audio_key. Everything before `first_recent_seq` lives in the store.
+    """
+
+    def __init__(self, session_id, store, registry=None, window=TRANSCRIPT_WINDOW,
+                 max_bytes=int(TRANSCRIPT_SESSION_MAX_KB * 1024)):
+        self.session_id = session_id
+        self.store = store
+        self.registry = registry
+        self.window = window
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._recent = []
+        self._next_seq = 0
+        self.nbytes = 0
+        self.last_active = time.monotonic()
+        if registry is not None:
+            registry.track(self)
+
+    @property
+    def first_recent_seq(self):
+        with self._lock:
+            return self._recent[0]["seq"] if self._recent else self._next_seq
+
+    def recent(self):
+        """Snapshot of the in-memory messages, oldest first."""
+        with self._lock:
+            return list(self._recent)
+
+    def append(self, role, content, audio_key=None):
+        message = {"seq": None, "role": role, "content": content}
+        if audio_key:
+            message["audio_key"] = audio_key
+        with self._lock:
+            message["seq"] = self._next_seq
+            self._next_seq += 1
+            self._recent.append(message)
+            self.nbytes += message_size(message)
+            self.last_active = time.monotonic()
+            # Spill in batches (down to half the window) so a long chat is not one write per message
+            if len(self._recent) > self.window:
+                self._spill_locked(max(self.window // 2, 1))
+            if self.nbytes > self.max_bytes:
+                self._spill_locked(MIN_WINDOW, self.max_bytes // 2)
+        if self.registry is not None:
+            self.registry.enforce()
+        return message
+
+    def spill(self, keep=MIN_WINDOW):
+        """Moves all but the last `keep` messages to the store. Returns the bytes freed."""
+        with self._lock:
+            return self._spill_locked(keep)
+
+    def _spill_locked(self, keep, target_bytes=None):
+        count = 0
+        freed = 0
+        # Oldest first, down to `keep` messages, or earlier once at most `target_bytes` remain
+        while len(self._recent) - count > keep:
+            if target_bytes is not None and self.nbytes - freed <= target_bytes:
+                break
+            freed += message_size(self._recent[count])
+            count += 1
+        if not count:
+            return 0
+        spilled = self._recent[:count]
+        try:
+            self.store.append(self.session_id, spilled)
+        except Exception:
+            # Keep the messages in memory rather than lose them; the next append tries again
+            REGISTRY.inc("edubot_transcript_spill_failed_total", help_text="Transcript spills that failed to write")
+            return 0
+        del self._recent[:count]
+        self.nbytes -= freed
+        REGISTRY.inc("edubot_transcript_spilled_total", count, help_text="Chat messages moved out of session memory")
+        return freed
+
+    def load_older(self, before_seq=None, limit=TRANSCRIPT_WINDOW):
+        """A page of spilled messages before `before_seq` (default: before the in-memory window)."""
+        before_seq = self.first_recent_seq if before_seq is None else before_seq
+        return self.store.load(self.session_id, before_seq, limit)
+
+
+# ==========================================
+# 3. PROCESS-WIDE CAP
+# ==========================================
+class TranscriptRegistry:
+    """
+    Tracks every live SessionTranscript in the process (weakly, so ended sessions are freed)
+    and spills the least recently active ones when their total exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=int(TRANSCRIPT_GLOBAL_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._transcripts = weakref.WeakSet()
+
+    def track(self, transcript):
+        with self._lock:
+            self._transcripts.add(transcript)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(t.nbytes for t in self._transcripts)
+
+    def enforce(self):
+        with self._lock:
+            transcripts = list(self._transcripts)
+        total = sum(t.nbytes for t in transcripts)
+        if total <= self.max_bytes:
+            return
+        # Target a bit below the cap so the next few messages do not trigger another pass
+        target = self.max_bytes * 0.8
+        for transcript in sorted(transcripts, key=lambda t: t.last_active):
+            if total <= target:
+                break
+            total -= transcript.spill(MIN_WINDOW)
+        REGISTRY.inc("edubot_transcript_global_spills_total", help_text="Passes that spilled sessions over the global cap")
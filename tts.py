@@ -0,0 +1,216 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "200"))
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+
+
+# ==========================================
+# 1. BACKENDS
+# ==========================================
+class GTTSBackend:
+    """Google TTS. 'en' with tld='co.in' gives a nice Indian English accent."""
+
+    def __init__(self, lang="en", tld="co.in"):
+        self.lang = lang
+        self.tld = tld
+        self.name = f"gtts-{lang}-{tld}"
+
+    def synthesize(self, text):
+        from io import BytesIO
+        from gtts import gTTS
+
+        sound_file = BytesIO()
+        gTTS(text, lang=self.lang, tld=self.tld).write_to_fp(sound_file)
+        return sound_file.getvalue()
+
+
+class SilentBackend:
+    """
+    Offline stand-in for tests and benchmarks: returns deterministic bytes derived from the
+    text instead of calling a speech service.
+    """
+
+    name = "silent"
+
+    def synthesize(self, text):
+        return b"ID3" + hashlib.sha256(text.encode("utf-8")).digest()
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "silent": SilentBackend,
+}
+
+
+def make_backend(name=TTS_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+# ==========================================
+# 2. DISK CACHE
+# ==========================================
+class AudioCache:
+    """
+    Content-addressed MP3 cache on disk, bounded by `max_bytes`.
+    Reads refresh a file's mtime, so eviction removes the least recently used files first.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=int(TTS_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {
+            entry.name: entry.stat().st_size
+            for entry in os.scandir(directory) if entry.name.endswith(".mp3")
+        }
+
+    @staticmethod
+    def key_for(backend_name, text):
+        return hashlib.sha256(f"{backend_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._sizes[f"{key}.mp3"] = len(data)
+            self._evict(keep=f"{key}.mp3")
+
+    def _evict(self, keep):
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(self._sizes, key=lambda name: self._mtime(name))
+        for name in by_age:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= self._sizes.pop(name)
+
+    def _mtime(self, name):
+        try:
+            return os.path.getmtime(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return 0.0
+
+
+# ==========================================
+# 3. SENTENCE PIPELINE
+# ==========================================
+# Sentence ends: . ! ? and the Devanagari danda, followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+_MARKDOWN = re.compile(r"[*_`#>]+")
+
+
+def clean_for_speech(text):
+    return _MARKDOWN.sub("", text).strip()
+
+
+def split_sentences(text):
+    return [s for s in (clean_for_speech(part) for part in _SENTENCE_END.split(text)) if s]
+
+
+class SpeechPipeline:
+    """
+    Synthesizes an answer sentence by sentence on worker threads.
+    feed() the streamed text as it arrives; every completed sentence is submitted right away,
+    so audio for the first sentence is ready while the rest is still generating.
+    finish() waits for the remaining sentences and returns the cache key of the full audio.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.buffer = ""
+        self.sentences = []
+        self.futures = []
+
+    def _submit(self, sentence):
+        sentence = clean_for_speech(sentence)
+        if sentence:
+            self.sentences.append(sentence)
+            self.futures.append(self.service.executor.submit(self.service.synthesize_sentence, sentence))
+
+    def feed(self, text):
+        self.buffer += text
+        parts = _SENTENCE_END.split(self.buffer)
+        for sentence in parts[:-1]:
+            self._submit(sentence)
+        self.buffer = parts[-1]
+
+    def finish(self):
+        self._submit(self.buffer)
+        self.buffer = ""
+        if not self.futures:
+            return None
+
+        full_key = self.service.key_for(" ".join(self.sentences))
+        if self.service.cache.get(full_key) is None:
+            # MP3 frames can be concatenated directly
+            audio = b"".join(future.result() for future in self.futures)
+            self.service.cache.put(full_key, audio)
+        return full_key
+
+
+class SpeechService:
+    """Shared TTS backend, disk cache and worker pool. One instance per process."""
+
+    def __init__(self, backend=None, cache=None, max_workers=TTS_WORKERS):
+        self.backend = backend or make_backend()
+        self.cache = cache or AudioCache()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    def key_for(self, text):
+        return AudioCache.key_for(self.backend.name, text)
+
+    def synthesize_sentence(self, sentence):
+        key = self.key_for(sentence)
+        audio = self.cache.get(key)
+        if audio is None:
+            audio = self.backend.synthesize(sentence)
+            self.cache.put(key, audio)
+        return audio
+
+    def pipeline(self):
+        return SpeechPipeline(self)
+
+    def speak(self, text):
+        """Synthesizes a complete text (e.g. a cached answer) and returns its audio key."""
+        full_key = self.key_for(" ".join(split_sentences(text)))
+        if self.cache.get(full_key) is not None:
+            return full_key
+        pipeline = self.pipeline()
+        pipeline.feed(text)
+        return pipeline.finish()
+
+    def load(self, key):
+        """Audio bytes for a key returned by finish()/speak(), or None if it was evicted."""
+        return self.cache.get(key) if key else None